@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+
+"""Compute independent single-household requests together, in one simulation.
+
+The households of a batch are concatenated into one columnar population, each household being its own foyer fiscal
+and ménage, so that the formulas run once on the arrays of all the households. The values are then split back by
+household.
+"""
+
+
+import collections
+import time
+
+import numpy as np
+
+from openfisca_core import periods
+
+from .columnar_scenarios import ColumnarScenario, get_input_arrays, SingleEntityTemplate
+from .reform_deltas import calculate
+
+
+class SingleEntityBatch(object):
+    """
+    Batch of households given like in `Scenario.init_single_entity`, computed over the same period.
+
+    A batch is full when it has `max_size` households or when its first household was added `max_delay` seconds ago:
+    a server adds its requests to the batch, and computes them when it is full. Times are given by `clock`, in
+    seconds.
+    """
+
+    def __init__(self, tax_benefit_system, period, max_size = 1000, max_delay = 0.05, clock = time.time):
+        self.tax_benefit_system = tax_benefit_system
+        self.period = periods.period(period)
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.clock = clock
+        self.households = []
+        self.start_time = None
+        self.template_by_shape = {}
+
+    def add(self, parent1 = None, parent2 = None, enfants = None, foyer_fiscal = None, menage = None):
+        """Add a household to the batch and return its index."""
+        enfants = enfants or []
+        shape = (parent2 is not None, len(enfants))
+        template = self.template_by_shape.get(shape)
+        if template is None:
+            # The shape of the household is checked once, when its template is compiled.
+            template = self.template_by_shape[shape] = SingleEntityTemplate(self.tax_benefit_system,
+                parent2 = shape[0], enfants_count = shape[1])
+        if self.start_time is None:
+            self.start_time = self.clock()
+        self.households.append((
+            template,
+            [parent1 or {}] + ([parent2 or {}] if parent2 is not None else []) + enfants,
+            foyer_fiscal or {},
+            menage or {},
+            ))
+        return len(self.households) - 1
+
+    def is_full(self):
+        return len(self.households) >= self.max_size or (
+            self.start_time is not None and self.clock() - self.start_time >= self.max_delay)
+
+    def new_scenario(self):
+        """Return the columnar scenario of the households of the batch, the i-th household being the i-th entity."""
+        templates = [template for template, individus, foyer_fiscal, menage in self.households]
+        tax_benefit_system = self.tax_benefit_system
+        input_arrays = get_input_arrays(tax_benefit_system, self.period, {
+            tax_benefit_system.person_entity.key: [
+                individu
+                for template, individus, foyer_fiscal, menage in self.households
+                for individu in individus
+                ],
+            'foyer_fiscal': [foyer_fiscal for template, individus, foyer_fiscal, menage in self.households],
+            'menage': [menage for template, individus, foyer_fiscal, menage in self.households],
+            })
+        entity_index = np.repeat(
+            np.arange(len(templates), dtype = np.int32),
+            [template.persons_count for template in templates],
+            )
+        members = dict(
+            (key, (entity_index, np.concatenate([template.members[key][1] for template in templates])))
+            for key in ('foyer_fiscal', 'menage')
+            )
+        scenario = ColumnarScenario()
+        scenario.tax_benefit_system = tax_benefit_system
+        return scenario.init_from_arrays(self.period, input_arrays, members, persons_count = len(entity_index))
+
+    def calculate(self, variables_name):
+        """
+        Compute `variables_name` over the period of the batch for all its households, in one simulation, and empty
+        the batch.
+
+        Monthly variables are summed over the period when it is a year. Return, for each household in the order of
+        their addition, an array by variable name, with one value by entity of the household.
+        """
+        if not self.households:
+            return []
+        simulation = self.new_scenario().new_simulation()
+        persons_count = [template.persons_count for template, individus, foyer_fiscal, menage in self.households]
+        persons_offsets = np.cumsum(persons_count)[:-1]
+        arrays_by_name = {}
+        for name in variables_name:
+            array = calculate(simulation, name, self.period)
+            if simulation.get_variable_entity(name).is_person:
+                arrays_by_name[name] = np.split(array, persons_offsets)
+            else:
+                arrays_by_name[name] = array.reshape(len(array), 1)
+        results = [
+            collections.OrderedDict(
+                (name, arrays_by_name[name][index])
+                for name in variables_name
+                )
+            for index in range(len(self.households))
+            ]
+        self.households = []
+        self.start_time = None
+        return results
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+
+"""Build the simulation of a population from arrays, without a test case.
+
+The inputs are arrays with one value by entity, and the composition of the group entities is given by two arrays with
+one value by individual: the index of its entity and the index of its role in `entity.roles`, i.e. declarant (0) or
+personne à charge (1) in a foyer fiscal, and personne de référence (0), conjoint (1), enfant (2) or autre (3) in a
+ménage. The arrays of the entities are computed with NumPy, without any Python object by row.
+"""
+
+
+import numpy as np
+
+from openfisca_core import periods, scenarios
+
+from .scenarios import check_trusted_test_case
+
+
+def get_ranks(groups):
+    """Return the rank of each element among the elements of the same group, in the order of the elements."""
+    count = len(groups)
+    if (groups[1:] >= groups[:-1]).all():
+        # Individuals are usually sorted by entity.
+        order = np.arange(count)
+    else:
+        order = np.argsort(groups, kind = 'mergesort')  # Stable, to keep the order of the elements in each group
+    sorted_groups = groups[order]
+    starts = np.ones(count, dtype = bool)
+    starts[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    indices = np.arange(count)
+    ranks = np.empty(count, dtype = np.int32)
+    ranks[order] = indices - np.maximum.accumulate(np.where(starts, indices, 0))
+    return ranks
+
+
+def set_members(entity, entity_index, role_index):
+    """Set the members of a group entity from the index of the entity and the index of the role of each individual."""
+    entity_index = np.asarray(entity_index, dtype = np.int32)
+    role_index = np.asarray(role_index, dtype = np.int32)
+    persons_count = entity.simulation.persons.count
+    if len(entity_index) != persons_count or len(role_index) != persons_count:
+        raise ValueError("The members of {} must have one value by individual".format(entity.plural))
+    if persons_count and (entity_index.min() < 0 or role_index.min() < 0 or role_index.max() >= len(entity.roles)):
+        raise ValueError("Invalid entity or role index in the members of {}".format(entity.plural))
+    count = entity_index.max() + 1 if persons_count else 0
+    rank_in_role = get_ranks(entity_index.astype(np.int64) * len(entity.roles) + role_index)
+
+    # Legacy roles are numbered as in the test cases: each role starts after the maximum count of the previous ones.
+    legacy_role_offsets = np.cumsum([0] + [role.max or 1 for role in entity.roles])[:-1]
+    members_legacy_role = (legacy_role_offsets[role_index] + rank_in_role).astype(np.int32)
+    members_role = np.empty(persons_count, dtype = object)
+    for index, role in enumerate(entity.roles):
+        in_role = role_index == index
+        if role.subroles:
+            if (rank_in_role[in_role] >= len(role.subroles)).any():
+                raise ValueError("Too many {} in an entity of {}".format(role.plural, entity.plural))
+            for rank, subrole in enumerate(role.subroles):
+                members_role[in_role & (rank_in_role == rank)] = subrole
+        else:
+            if role.max == 1 and (rank_in_role[in_role] > 0).any():
+                raise ValueError("Too many {} in an entity of {}".format(role.key, entity.plural))
+            members_role[in_role] = role
+
+    entity.count = entity.step_size = count
+    entity.ids = range(count)
+    entity.members_entity_id = entity_index
+    entity.members_role = members_role
+    entity.members_legacy_role = members_legacy_role
+    entity._members_position = get_ranks(entity_index)
+    entity.roles_count = members_legacy_role.max() + 1 if persons_count else 0
+
+
+class ColumnarScenario(scenarios.AbstractScenario):
+    """Scenario of a population given by arrays, see `init_from_arrays`."""
+    members = None
+    persons_count = None
+
+    def init_from_arrays(self, period, input_arrays, members, persons_count = None):
+        """
+        Set the population of the scenario.
+
+        `input_arrays` gives, by variable name, the array of the values of its entities over `period`, or a dict of
+        these arrays by period. `members` gives, by group entity key, the pair of the arrays of the index of the
+        entity and of the index of the role of each individual. Without `members` for a group entity, each
+        individual is alone in its entity, with its first role. The count of individuals is the length of the arrays
+        of members, `persons_count` when there are none.
+        """
+        self.axes = None
+        self.test_case = None
+        self.period = periods.period(period)
+        self.input_variables = dict(
+            (name, dict(
+                (periods.period(array_period), array)
+                for array_period, array in array_or_array_by_period.iteritems()
+                ) if isinstance(array_or_array_by_period, dict) else {self.period: array_or_array_by_period})
+            for name, array_or_array_by_period in input_arrays.iteritems()
+            )
+        self.members = members
+        if persons_count is None:
+            assert members, "The count of individuals must be given when there are no members"
+            persons_count = len(members.itervalues().next()[0])
+        self.persons_count = persons_count
+        return self
+
+    def fill_simulation(self, simulation):
+        tax_benefit_system = self.tax_benefit_system
+        persons = simulation.persons
+        persons.count = persons.step_size = self.persons_count
+        persons.ids = range(self.persons_count)
+        for entity in simulation.entities.itervalues():
+            if entity.is_person:
+                continue
+            entity_members = self.members.get(entity.key)
+            if entity_members is None:
+                entity_members = np.arange(persons.count), np.zeros(persons.count)
+            set_members(entity, *entity_members)
+
+        for name, array_by_period in self.input_variables.iteritems():
+            column = tax_benefit_system.get_column(name, check_existence = True)
+            holder = simulation.get_variable_entity(name).get_holder(name)
+            # Set days, before months, before years, as the core does
+            for period in sorted(array_by_period, cmp = periods.compare_period_size):
+                array = np.asarray(array_by_period[period], dtype = column.dtype)
+                if len(array) != holder.entity.count:
+                    raise ValueError("The array of {} must have one value by entity of {}".format(
+                        name, holder.entity.plural))
+                holder.set_input(period, array)
+
+
+def new_columnar_scenario(tax_benefit_system, period, input_arrays, members, persons_count = None):
+    """Return the scenario of the population given by arrays, see `ColumnarScenario.init_from_arrays`."""
+    scenario = ColumnarScenario()
+    scenario.tax_benefit_system = tax_benefit_system
+    return scenario.init_from_arrays(period, input_arrays, members, persons_count = persons_count)
+
+
+def get_input_arrays(tax_benefit_system, period, rows_by_entity_key):
+    """
+    Return the input arrays of a population given, by entity key, by the list of the dicts of the values of its
+    entities.
+
+    Values are Python values of the type of their variable, or dicts of these values by period. They aren't
+    converted nor checked, except for their entity.
+    """
+    input_arrays = {}
+    for entity_key, rows in rows_by_entity_key.iteritems():
+        for index, row in enumerate(rows):
+            for name, value in row.iteritems():
+                if name == 'id':
+                    continue
+                column = tax_benefit_system.get_column(name, check_existence = True)
+                if column.entity.key != entity_key:
+                    raise ValueError("Variable {} isn't defined for entity {}".format(name, entity_key))
+                array_by_period = input_arrays.setdefault(name, {})
+                for value_period, period_value in (value.iteritems() if isinstance(value, dict)
+                        else [(period, value)]):
+                    value_period = periods.period(value_period)
+                    array = array_by_period.get(value_period)
+                    if array is None:
+                        array = array_by_period[value_period] = np.empty(len(rows), dtype = column.dtype)
+                        array.fill(column.default)
+                    array[index] = period_value
+    return input_arrays
+
+
+class SingleEntityTemplate(object):
+    """
+    Household of the shape of `Scenario.init_single_entity`, compiled once to instantiate scenarios of new values
+    without any conversion.
+
+    The household has a first parent, a second one when `parent2` is true and `enfants_count` children, in one foyer
+    fiscal and one ménage. Its composition is checked once, when the template is compiled.
+    """
+
+    def __init__(self, tax_benefit_system, parent2 = False, enfants_count = 0):
+        self.tax_benefit_system = tax_benefit_system
+        self.parent2 = parent2
+        self.enfants_count = enfants_count
+        parents_id = ['ind0', 'ind1'] if parent2 else ['ind0']
+        enfants_id = ['ind{}'.format(index) for index in range(2, 2 + enfants_count)]
+        check_trusted_test_case(tax_benefit_system, dict(
+            foyers_fiscaux = [dict(id = 'foyer_fiscal', declarants = parents_id, personnes_a_charge = enfants_id)],
+            individus = [dict(id = individu_id) for individu_id in parents_id + enfants_id],
+            menages = [dict(
+                dict(zip(['personne_de_reference', 'conjoint'], parents_id)),
+                id = 'menage',
+                enfants = enfants_id,
+                )],
+            ))
+        self.persons_count = len(parents_id) + enfants_count
+        positions = np.arange(self.persons_count)
+        is_enfant = positions >= len(parents_id)
+        self.members = dict(
+            foyer_fiscal = (np.zeros(self.persons_count, dtype = np.int32), is_enfant * 1),
+            menage = (np.zeros(self.persons_count, dtype = np.int32), np.where(is_enfant, 2, positions)),
+            )
+
+    def new_scenario(self, period, parent1 = None, parent2 = None, enfants = None, foyer_fiscal = None,
+            menage = None):
+        """
+        Return the columnar scenario of the household of the template with the values of `init_single_entity`.
+
+        Values aren't converted, see get_input_arrays.
+        """
+        period = periods.period(period)
+        enfants = enfants or []
+        if (parent2 is not None) != self.parent2 or len(enfants) != self.enfants_count:
+            raise ValueError("The household doesn't have the shape of the template")
+        individus = [parent1 or {}] + ([parent2 or {}] if self.parent2 else []) + enfants
+        tax_benefit_system = self.tax_benefit_system
+        input_arrays = get_input_arrays(tax_benefit_system, period, {
+            tax_benefit_system.person_entity.key: individus,
+            'foyer_fiscal': [foyer_fiscal or {}],
+            'menage': [menage or {}],
+            })
+        scenario = ColumnarScenario()
+        scenario.tax_benefit_system = tax_benefit_system
+        return scenario.init_from_arrays(period, input_arrays, self.members, persons_count = self.persons_count)
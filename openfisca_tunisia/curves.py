@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+
+"""Compute variables of a household as curves of one of its inputs.
+
+The simulation of the household is stacked once by point of the curve, see `new_stacked_simulation`, and the axis
+input is set directly as an array, instead of replicating the test case of the household for each point.
+"""
+
+
+import collections
+
+import numpy as np
+
+from openfisca_core import periods
+
+from .parameter_sweeps import new_stacked_simulation
+from .reform_deltas import calculate, iter_arrays, record_inputs
+
+
+def new_curve_simulation(scenario, axis_name, values, period, person_index = 0):
+    """
+    Return the simulation of the household of `scenario` stacked once by value of `values`, where the input
+    `axis_name` of the `person_index`-th individual over `period` is the value of the copy.
+    """
+    period = periods.period(period)
+    values = np.asarray(values, dtype = float)
+    simulation = scenario.new_simulation()
+    record_inputs(simulation)
+    column = simulation.tax_benefit_system.get_column(axis_name, check_existence = True)
+    assert column.entity.is_person, "The axis of a curve must be a variable of individuals"
+    base_array = calculate(simulation, axis_name, period)
+    curve_simulation = new_stacked_simulation(simulation, len(values), [axis_name])
+    array = np.tile(base_array, len(values))
+    array[person_index::len(base_array)] = values
+    curve_simulation.persons.get_holder(axis_name).set_input(period, array.astype(column.dtype))
+    curve_simulation.input_arrays = [
+        input_array
+        for input_array in curve_simulation.input_arrays
+        if input_array[1] != axis_name
+        ] + [
+        input_array
+        for input_array in iter_arrays(curve_simulation)
+        if input_array[1] == axis_name
+        ]
+    return curve_simulation
+
+
+def calculate_curve(scenario, axis_name, values, variables_name, period, person_index = 0):
+    """
+    Compute `variables_name` over `period` for the household of `scenario`, the input `axis_name` of its
+    `person_index`-th individual taking each of the `values` over `period`.
+
+    Monthly variables are summed over `period` when it is a year. Return, by variable name, an array (number of
+    values x number of entities of the household).
+    """
+    period = periods.period(period)
+    curve_simulation = new_curve_simulation(scenario, axis_name, values, period, person_index = person_index)
+    array_by_name = collections.OrderedDict()
+    for name in variables_name:
+        array = calculate(curve_simulation, name, period)
+        array_by_name[name] = array.reshape(len(values), len(array) // len(values))
+    return array_by_name
+
+
+def get_scale(points, values):
+    # Rounding errors of formulas computed in simple precision grow with the amounts of the household.
+    return 1 + max(np.abs(points).max(), np.abs(values).max())
+
+
+def get_collinear(points, values, tolerance):
+    """Return whether the rows of `values` at the sorted `points` are on the line through the first and last rows."""
+    weights = (points - points[0]) / (points[-1] - points[0])
+    chord = values[0] + weights[:, np.newaxis] * (values[-1] - values[0])
+    return (np.abs(values - chord) <= tolerance * get_scale(points, values)).all()
+
+
+def get_kinks(points, values, tolerance):
+    """
+    Return the abscissas, between the second and the fourth of five sorted `points`, where the line through the
+    first two rows of `values` meets the line through the last two, for the columns which are not linear.
+    """
+    left_slopes = (values[1] - values[0]) / (points[1] - points[0])
+    right_slopes = (values[4] - values[3]) / (points[4] - points[3])
+    slopes_difference = left_slopes - right_slopes
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        kinks = points[3] + (values[3] - values[0] - left_slopes * (points[3] - points[0])) / slopes_difference
+        kinks = kinks[(np.abs(slopes_difference) * (points[4] - points[0]) > tolerance * get_scale(points, values)) &
+            (kinks > points[1]) & (kinks < points[3])]
+    return np.unique(kinks)
+
+
+def remove_collinear_points(points, values, tolerance):
+    """
+    Return the indices of the sorted `points` to keep so that the curves stay linear between consecutive kept points.
+
+    Curves being linear between consecutive `points`, a point is removed when it is on the line between the previous
+    kept point and the next point, like the points removed before it.
+    """
+    indices = [0]
+    for index in range(1, len(points) - 1):
+        run = slice(indices[-1], index + 2)
+        if not get_collinear(points[run], values[run], tolerance):
+            indices.append(index)
+    indices.append(len(points) - 1)
+    return indices
+
+
+def calculate_breakpoints(scenario, axis_name, bounds, variables_name, period, person_index = 0, initial_count = 9,
+        precision = 1e-2, tolerance = 1e-6):
+    """
+    Compute the curves of `variables_name`, like calculate_curve, at their breakpoints between the `bounds` of the
+    axis only: the curves are linear between consecutive values of the axis returned.
+
+    The formulas being piecewise linear, the axis is refined where the curves are not linear. The three quarters of
+    each interval are evaluated: if the curves are not linear, the interval is split where the lines of its two
+    ends meet, i.e. at the kink when there is only one. Discontinuities are located up to `precision`. Values are
+    compared up to `tolerance` relatively to the amounts of the interval, formulas being computed in simple
+    precision. Each refinement evaluates all its new points in one simulation. Return the values of the axis and, by
+    variable name, an array (number of values of the axis x number of entities of the household).
+    """
+    period = periods.period(period)
+    row_by_point = {}
+    # Columns of the rows of each variable, one by entity of the household
+    columns_by_name = collections.OrderedDict()
+
+    def evaluate(points):
+        points = sorted(set(points) - set(row_by_point))
+        if points:
+            array_by_name = calculate_curve(scenario, axis_name, points, variables_name, period,
+                person_index = person_index)
+            start = 0
+            for name, array in array_by_name.iteritems():
+                columns_by_name[name] = slice(start, start + array.shape[1])
+                start += array.shape[1]
+            rows = np.hstack([array.astype(float) for array in array_by_name.itervalues()])
+            row_by_point.update(zip(points, rows))
+
+    def get_values(points):
+        return np.array([row_by_point[point] for point in points])
+
+    lower, upper = bounds
+    points = list(np.linspace(lower, upper, initial_count))
+    intervals = zip(points[:-1], points[1:])
+    kept_points = set(points)
+    while intervals:
+        probes_by_interval = [
+            np.linspace(start, stop, 5)
+            for start, stop in intervals
+            ]
+        evaluate(np.concatenate(probes_by_interval))
+        intervals = []
+        for probes in probes_by_interval:
+            values = get_values(probes)
+            if get_collinear(probes, values, tolerance):
+                continue
+            if probes[-1] - probes[0] < precision:
+                kept_points.update(probes)
+                continue
+            kinks = get_kinks(probes, values, tolerance)
+            if len(kinks) == 0:
+                kinks = probes[1:-1]
+            kept_points.update(kinks)
+            ends = [probes[0]] + list(kinks) + [probes[-1]]
+            intervals.extend(zip(ends[:-1], ends[1:]))
+
+    kept_points = np.array(sorted(kept_points))
+    values = get_values(kept_points)
+    indices = remove_collinear_points(kept_points, values, tolerance)
+    kept_points = kept_points[indices]
+    values = values[indices]
+    return kept_points, collections.OrderedDict(
+        (name, values[:, columns])
+        for name, columns in columns_by_name.iteritems()
+        )
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import division
+
+from numpy import array, asarray, concatenate, cumsum, diff, float64, ndarray, searchsorted, take, where, zeros
+
+from openfisca_core.commons import empty_clone
+from openfisca_core.taxscales import MarginalRateTaxScale
+
+
+def compiler_bareme(bareme):
+    '''
+    Seuils d'un barème à taux marginaux, et pour chaque tranche, précédée de la tranche nulle sous le premier seuil,
+    l'ordonnée à l'origine et le taux de la droite donnant l'impôt
+    '''
+    seuils = array(bareme.thresholds, dtype = float64)
+    taux = array(bareme.rates, dtype = float64)
+    assert (diff(seuils) > 0).all(), u"Les seuils du barème {} ne sont pas croissants".format(bareme.name)
+    # Impôt cumulé à chaque seuil
+    cumuls = concatenate(([0], cumsum(taux[:-1] * diff(seuils))))
+    return seuils, concatenate(([0], cumuls - taux * seuils)), concatenate(([0], taux))
+
+
+def est_vectoriel(bareme):
+    '''
+    Indique si les seuils ou les taux du barème sont des vecteurs, d'une valeur par ligne de la population
+    '''
+    return any(isinstance(valeur, ndarray) for valeur in bareme.thresholds + bareme.rates)
+
+
+def extraire_lignes(bareme, lignes):
+    '''
+    Barème restreint aux lignes `lignes` de la population, quand ses seuils ou ses taux sont des vecteurs
+    '''
+    if not est_vectoriel(bareme):
+        return bareme
+    bareme_lignes = empty_clone(bareme)
+    bareme_lignes.__dict__ = bareme.__dict__.copy()
+    bareme_lignes.thresholds = [
+        seuil[lignes] if isinstance(seuil, ndarray) else seuil
+        for seuil in bareme.thresholds
+        ]
+    bareme_lignes.rates = [
+        taux[lignes] if isinstance(taux, ndarray) else taux
+        for taux in bareme.rates
+        ]
+    return bareme_lignes
+
+
+def calculer_bareme(bareme, base, lignes = None):
+    '''
+    Applique un barème à taux marginaux, comme MarginalRateTaxScale.calc sans facteur ni arrondi
+
+    La tranche de chaque élément est trouvée par recherche dichotomique parmi les seuils, et l'impôt est lu sur la
+    droite de cette tranche : le coût par élément ne croît qu'avec le logarithme du nombre de tranches, et aucune
+    matrice (éléments x tranches) n'est allouée. Les barèmes qui redéfinissent calc, comme ceux dont les taux sont
+    des vecteurs, sont appliqués par leur propre méthode, restreints aux lignes `lignes` de la population.
+    '''
+    if lignes is not None:
+        bareme = extraire_lignes(bareme, lignes)
+    if type(bareme).calc.im_func is not MarginalRateTaxScale.calc.im_func:
+        return bareme.calc(base)
+    base = asarray(base)
+    if not bareme.thresholds:
+        return zeros(len(base))
+    seuils, ordonnees, taux = compiler_bareme(bareme)
+    tranche = searchsorted(seuils, base, side = 'right')
+    return take(ordonnees, tranche) + take(taux, tranche) * base
+
+
+def calculer_taux_marginal(bareme, base):
+    '''
+    Taux marginal d'un barème à taux marginaux, dérivée à droite de calculer_bareme : nul sous le premier seuil
+    '''
+    if not bareme.thresholds:
+        return zeros(len(base))
+    if est_vectoriel(bareme):
+        taux = zeros(len(base))
+        for seuil, taux_tranche in zip(bareme.thresholds, bareme.rates):
+            taux = where(base >= seuil, taux_tranche, taux)
+        return taux
+    seuils, ordonnees, taux = compiler_bareme(bareme)
+    return take(taux, searchsorted(seuils, base, side = 'right'))
@@ -74,5 +74,5 @@ class revenus_du_travail(Variable):
     definition_period = YEAR
 
     def formula(individu, period):
-        salaire_imposable = individu('salaire_imposable', period = period, options = [ADD])
+        salaire_imposable = individu('salaire_imposable_annuel', period = period)
         return salaire_imposable  # + beap + bic + bnc  TODO
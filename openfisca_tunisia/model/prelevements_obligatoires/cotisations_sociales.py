@@ -3,37 +3,314 @@
 
 from __future__ import division
 
-from numpy import zeros
+import collections
+import weakref
+
+from numpy import arange, array, ix_, searchsorted, tile, zeros
+
+from openfisca_core.taxscales import MarginalRateTaxScale
 
 from openfisca_tunisia.model.base import *  # noqa analysis:ignore
+from openfisca_tunisia.model.baremes import calculer_bareme, est_vectoriel
 
 CAT = Enum(['rsna', 'rsa', 'rsaa', 'rtns', 'rtte', 're', 'rtfr', 'raci', 'cnrps_sal', 'cnrps_pen'])
 
 
-def compute_cotisation(individu, period, cotisation_type = None, bareme_name = None, legislation = None):
-    assert cotisation_type in ['employeur', 'salarie']
+# Cotisations calculées par le noyau commun compute_cotisations :
+# (nom de la variable, type de cotisation, nom du barème)
+COTISATIONS = [
+    ('accident_du_travail_employeur', 'employeur', 'accident_du_travail'),
+    ('accident_du_travail_salarie', 'salarie', 'accident_du_travail'),
+    ('deces_employeur', 'employeur', 'deces'),
+    ('deces_salarie', 'salarie', 'deces'),
+    ('famille_employeur', 'employeur', 'famille'),
+    ('famille_salarie', 'salarie', 'famille'),
+    ('fonds_special_etat', 'employeur', 'fonds_special_etat'),
+    ('maladie_employeur', 'employeur', 'maladie'),
+    ('maladie_salarie', 'salarie', 'maladie'),
+    ('maternite_employeur', 'employeur', 'maternite'),
+    ('maternite_salarie', 'salarie', 'maternite'),
+    ('protection_sociale_travailleurs_employeur', 'employeur', 'protection_sociale_travailleurs'),
+    ('protection_sociale_travailleurs_salarie', 'salarie', 'protection_sociale_travailleurs'),
+    ('retraite_employeur', 'employeur', 'retraite'),
+    ('retraite_salarie', 'salarie', 'retraite'),
+    ]
+
+cotisation_index_by_key = dict(
+    ((cotisation_type, bareme_name), index)
+    for index, (_, cotisation_type, bareme_name) in enumerate(COTISATIONS)
+    )
+
+
+def get_bareme(baremes_regime, cotisation_type, bareme_name):
+    '''
+    Cherche le barème d'une cotisation dans le nœud de législation d'un régime.
+
+    Les barèmes sont rangés sous cotisations_employeur ou cotisations_salarie, et ceux des assurances sociales
+    (maladie, maternité, décès) éventuellement sous assurances_sociales. Les régimes dont les barèmes ne suivent pas
+    cette structure (nœud sal, absence de distinction employeur/salarié) n'ont pas de barème.
+    '''
+    bareme_by_name = baremes_regime.get('cotisations_{}'.format(cotisation_type))
+    if bareme_by_name is None:
+        return None
+    if bareme_name in ['maladie', 'maternite', 'deces']:
+        baremes_assurances_sociales = bareme_by_name.get('assurances_sociales')
+        if baremes_assurances_sociales is not None:
+            return baremes_assurances_sociales.get(bareme_name)
+    return bareme_by_name.get(bareme_name)
+
+
+# Tables des barèmes par nœud de législation cotisations_sociales, c'est-à-dire par date de législation
+baremes_cotisations_by_legislation = weakref.WeakKeyDictionary()
+
+
+def compile_baremes_cotisations(baremes_by_regime):
+    '''
+    Résout une fois pour toutes les barèmes de chaque triplet (régime, payeur, cotisation).
+
+    Renvoie une table plate indexée par l'indice du régime dans CAT, dont chaque élément est la liste des couples
+    (indice de la cotisation dans COTISATIONS, barème) définis pour ce régime.
+    '''
+    baremes_cotisations = [[] for _ in CAT]
+    for regime_name, regime_index in CAT:
+        baremes_regime = baremes_by_regime[regime_name]
+        for index, (_, cotisation_type, bareme_name) in enumerate(COTISATIONS):
+            bareme = get_bareme(baremes_regime, cotisation_type, bareme_name)
+            if bareme is not None:
+                baremes_cotisations[regime_index].append((index, bareme))
+    return baremes_cotisations
+
+
+def get_baremes_cotisations(individu, period, legislation):
+    baremes_by_regime = legislation(period.start).cotisations_sociales
+    if individu.simulation.trace:
+        # Les paramètres lus doivent être tracés pour chaque variable.
+        return compile_baremes_cotisations(baremes_by_regime)
+    baremes_cotisations = baremes_cotisations_by_legislation.get(baremes_by_regime)
+    if baremes_cotisations is None:
+        baremes_cotisations = baremes_cotisations_by_legislation[baremes_by_regime] = compile_baremes_cotisations(
+            baremes_by_regime)
+    return baremes_cotisations
+
+
+# Barèmes agrégés par type de cotisation, par nœud de législation cotisations_sociales
+baremes_agreges_by_legislation = weakref.WeakKeyDictionary()
+
+
+def compile_baremes_agreges(baremes_cotisations):
+    '''
+    Combine en un seul barème à taux marginaux les barèmes employeur, et les barèmes salarié, de chaque régime.
+
+    Renvoie une table indexée par l'indice du régime dans CAT, dont chaque élément associe à chaque type de
+    cotisation le barème somme de ses cotisations, ou None si le régime n'en définit aucune. Renvoie None si des
+    barèmes ont des paramètres vectoriels, qui ne peuvent être combinés.
+    '''
+    if any(est_vectoriel(bareme) for baremes_regime in baremes_cotisations for index, bareme in baremes_regime):
+        return None
+    baremes_agreges = []
+    for baremes_regime in baremes_cotisations:
+        bareme_by_type = dict.fromkeys(['employeur', 'salarie'])
+        for index, bareme in baremes_regime:
+            cotisation_type = COTISATIONS[index][1]
+            bareme_agrege = bareme_by_type[cotisation_type]
+            if bareme_agrege is None:
+                bareme_agrege = bareme_by_type[cotisation_type] = MarginalRateTaxScale(
+                    name = 'cotisations_{}'.format(cotisation_type))
+                bareme_agrege.add_bracket(0, 0)
+            bareme_agrege.add_tax_scale(bareme)
+        baremes_agreges.append(bareme_by_type)
+    return baremes_agreges
+
+
+def get_baremes_agreges(individu, period, legislation):
+    baremes_by_regime = legislation(period.start).cotisations_sociales
+    if baremes_by_regime not in baremes_agreges_by_legislation:
+        baremes_agreges_by_legislation[baremes_by_regime] = compile_baremes_agreges(
+            get_baremes_cotisations(individu, period, legislation))
+    return baremes_agreges_by_legislation[baremes_by_regime]
+
+
+def partition_by_regime(categorie_salarie):
+    '''
+    Trie une fois les individus par régime.
+
+    Renvoie la liste (nom du régime, indice du régime, indices des individus du régime) des seuls régimes présents.
+    '''
+    order = categorie_salarie.argsort(kind = 'mergesort')
+    bounds = searchsorted(categorie_salarie[order], arange(len(CAT) + 1))
+    return [
+        (regime_name, regime_index, order[bounds[regime_index]:bounds[regime_index + 1]])
+        for regime_name, regime_index in CAT
+        if bounds[regime_index + 1] > bounds[regime_index]
+        ]
+
+
+def compute_cotisations_matrix(assiette_cotisations_sociales, categorie_salarie, baremes_cotisations):
+    '''
+    Calcule en une seule passe sur la population l'ensemble des cotisations de COTISATIONS.
+
+    Chaque barème n'est évalué que sur les individus de son régime, les résultats sont ensuite replacés dans l'ordre
+    de la population. Renvoie une matrice (nombre de cotisations x nombre d'individus) dont les lignes suivent l'ordre
+    de COTISATIONS.
+    '''
+    cotisations = zeros((len(COTISATIONS), len(assiette_cotisations_sociales)))
+    for regime_name, regime_index, members in partition_by_regime(categorie_salarie):
+        assiette_regime = assiette_cotisations_sociales[members]
+        for index, bareme in baremes_cotisations[regime_index]:
+            cotisations[index, members] = calculer_bareme(bareme, assiette_regime, lignes = members)
+    return - cotisations
+
+
+def compute_cotisations(individu, period, legislation = None):
     assiette_cotisations_sociales = individu('assiette_cotisations_sociales', period)
     categorie_salarie = individu('categorie_salarie', period)  # TODO change to regime_salarie
-    baremes_by_regime = legislation(period.start).cotisations_sociales
-    cotisation = zeros(len(assiette_cotisations_sociales))
-    for regime_name, regime_index in CAT:
-        bareme_by_name = baremes_by_regime[regime_name].get(
-            'cotisations_{}'.format(cotisation_type))
-        if bareme_by_name is not None:
-            if bareme_name in ['maladie', 'maternite', 'deces']:
-                baremes_assurances_sociales = bareme_by_name.get('assurances_sociales')
-                if baremes_assurances_sociales is not None:
-                    bareme = baremes_assurances_sociales.get(bareme_name)
-                else:
-                    bareme = bareme_by_name.get(bareme_name)
-            else:
-                bareme = bareme_by_name.get(bareme_name)
+    baremes_cotisations = get_baremes_cotisations(individu, period, legislation)
+    return compute_cotisations_matrix(assiette_cotisations_sociales, categorie_salarie, baremes_cotisations)
 
-            if bareme is not None:
-                cotisation += bareme.calc(
-                    assiette_cotisations_sociales * (categorie_salarie == regime_index),
-                    )
-    return - cotisation
+
+def compute_cotisations_agregees(individu, period, cotisation_type, legislation):
+    '''
+    Calcule la somme des cotisations d'un type par un seul appel au barème agrégé de chaque régime.
+
+    Égale à la somme des cotisations de ce type aux arrondis des flottants près.
+    '''
+    assiette_cotisations_sociales = individu('assiette_cotisations_sociales', period)
+    categorie_salarie = individu('categorie_salarie', period)
+    baremes_agreges = get_baremes_agreges(individu, period, legislation)
+    cotisations = zeros(len(assiette_cotisations_sociales))
+    for regime_name, regime_index, members in partition_by_regime(categorie_salarie):
+        bareme = baremes_agreges[regime_index][cotisation_type]
+        if bareme is not None:
+            cotisations[members] = calculer_bareme(bareme, assiette_cotisations_sociales[members], lignes = members)
+    return - cotisations
+
+
+def is_aggregable(individu, period, cotisation_type, legislation):
+    # Le barème agrégé ne s'applique que si toutes les cotisations du type sont calculées par ce module, et
+    # qu'aucune n'est saisie ni déjà calculée pour la période. Les cotisations sont calculées une à une en mode debug
+    # ou trace, pour que leurs paramètres soient tracés.
+    simulation = individu.simulation
+    if simulation.debug or simulation.trace:
+        return False
+    return all(
+        holder.get_array(period) is None and has_formula_of_this_module(holder, period)
+        for holder in (
+            individu.get_holder(variable_name)
+            for variable_name, type_, _ in COTISATIONS
+            if type_ == cotisation_type
+            )
+        ) and get_baremes_agreges(individu, period, legislation) is not None
+
+
+def compute_cotisation(individu, period, cotisation_type = None, bareme_name = None, legislation = None):
+    assert cotisation_type in ['employeur', 'salarie']
+    cotisation_index = cotisation_index_by_key[(cotisation_type, bareme_name)]
+    cotisations = compute_cotisations(individu, period, legislation = legislation)
+    simulation = individu.simulation
+    if not (simulation.debug or simulation.trace):
+        # Les autres cotisations du même calcul sont mises en cache pour ne pas refaire la passe.
+        for index, (variable_name, _, _) in enumerate(COTISATIONS):
+            if index == cotisation_index:
+                continue
+            holder = individu.get_holder(variable_name)
+            if holder.get_array(period) is None and has_formula_of_this_module(holder, period):
+                holder.put_in_cache(cotisations[index].astype(holder.column.dtype), period)
+    return cotisations[cotisation_index]
+
+
+def has_formula_of_this_module(holder, period):
+    # Une réforme peut remplacer la formule d'une variable : son cache ne doit alors pas être rempli ici.
+    if holder.column.is_neutralized or holder.formula is None:
+        return False
+    function = holder.formula.find_function(period)
+    return function is not None and function.im_func.func_globals is globals()
+
+
+def compute_salaire_imposable_par_mois(individu, annee, legislation):
+    '''
+    Calcule salaire_imposable pour chacun des 12 mois de l'année : renvoie une matrice (12 x nombre d'individus).
+
+    Les mois où salaire_imposable, cotisations_salarie et les cotisations de COTISATIONS sont à calculer par les
+    formules de ce module sont empilés : le noyau des cotisations est évalué une seule fois sur leurs assiettes, et
+    chaque variable est mise en cache pour chaque mois sous forme d'une ligne de sa matrice. Les autres mois sont
+    calculés mois par mois.
+    '''
+    simulation = individu.simulation
+    first_month = annee.first_month
+    mois = [first_month.offset(index, MONTH) for index in range(12)]
+    salaire_imposable_holder = individu.get_holder('salaire_imposable')
+    cotisations_salarie_holder = individu.get_holder('cotisations_salarie')
+    cotisations_holders = [individu.get_holder(variable_name) for variable_name, _, _ in COTISATIONS]
+    if simulation.debug or simulation.trace:
+        indices_empiles = []
+    else:
+        indices_empiles = [
+            index
+            for index, month in enumerate(mois)
+            if all(
+                holder.get_array(month) is None and has_formula_of_this_module(holder, month)
+                for holder in [salaire_imposable_holder, cotisations_salarie_holder] + cotisations_holders
+                )
+            ]
+
+    salaire_imposable = zeros((12, individu.count), dtype = salaire_imposable_holder.column.dtype)
+    for index, month in enumerate(mois):
+        if index not in indices_empiles:
+            salaire_imposable[index] = individu('salaire_imposable', month)
+    if not indices_empiles:
+        return salaire_imposable
+
+    assiette_cotisations_sociales = array([
+        individu('assiette_cotisations_sociales', mois[index])
+        for index in indices_empiles
+        ])
+    ugtt = array([
+        individu('ugtt', mois[index], options = [ADD])
+        for index in indices_empiles
+        ])
+    regimes = partition_by_regime(individu('categorie_salarie', annee))
+    cotisations = zeros(
+        (len(COTISATIONS), len(indices_empiles), individu.count),
+        dtype = cotisations_holders[0].column.dtype,
+        )
+    # Les mois d'une même législation sont évalués ensemble
+    positions_by_baremes = collections.OrderedDict()
+    for position, index in enumerate(indices_empiles):
+        baremes_cotisations = get_baremes_cotisations(individu, mois[index], legislation)
+        positions_by_baremes.setdefault(id(baremes_cotisations), (baremes_cotisations, []))[1].append(position)
+    for baremes_cotisations, positions in positions_by_baremes.itervalues():
+        for regime_name, regime_index, members in regimes:
+            rows = ix_(positions, members)
+            assiette_regime = assiette_cotisations_sociales[rows]
+            for index, bareme in baremes_cotisations[regime_index]:
+                cotisations[index][rows] = - calculer_bareme(bareme, assiette_regime.ravel(),
+                    lignes = tile(members, len(positions))).reshape(assiette_regime.shape)
+
+    # Mêmes opérations, dans le même ordre, que la formule de cotisations_salarie
+    cotisation_by_name = dict(
+        (variable_name, cotisations[index])
+        for index, (variable_name, _, _) in enumerate(COTISATIONS)
+        )
+    cotisations_salarie = (
+        cotisation_by_name['accident_du_travail_salarie'] +
+        cotisation_by_name['deces_salarie'] +
+        cotisation_by_name['famille_salarie'] +
+        cotisation_by_name['maladie_salarie'] +
+        cotisation_by_name['maternite_salarie'] +
+        cotisation_by_name['protection_sociale_travailleurs_salarie'] +
+        cotisation_by_name['retraite_salarie'] +
+        ugtt
+        )
+    salaire_imposable_empile = assiette_cotisations_sociales + cotisations_salarie
+
+    for position, index in enumerate(indices_empiles):
+        month = mois[index]
+        for holder, cotisation in zip(cotisations_holders, cotisations[:, position]):
+            holder.put_in_cache(cotisation, month)
+        cotisations_salarie_holder.put_in_cache(cotisations_salarie[position], month)
+        salaire_imposable_holder.put_in_cache(salaire_imposable_empile[position], month)
+        salaire_imposable[index] = salaire_imposable_empile[position]
+    return salaire_imposable
 
 
 class assiette_cotisations_sociales(Variable):
@@ -75,7 +352,9 @@ class cotisations_employeur(Variable):
     label = u"Cotisation sociales employeur"
     definition_period = MONTH
 
-    def formula(individu, period):
+    def formula(individu, period, legislation):
+        if is_aggregable(individu, period, 'employeur', legislation):
+            return compute_cotisations_agregees(individu, period, 'employeur', legislation)
         return (
             individu('accident_du_travail_employeur', period) +
             individu('deces_employeur', period) +
@@ -94,7 +373,12 @@ class cotisations_salarie(Variable):
     label = u"Cotisation sociales salarié"
     definition_period = MONTH
 
-    def formula(individu, period):
+    def formula(individu, period, legislation):
+        if is_aggregable(individu, period, 'salarie', legislation):
+            return (
+                compute_cotisations_agregees(individu, period, 'salarie', legislation) +
+                individu('ugtt', period, options = [ADD])
+                )
         return (
             individu('accident_du_travail_salarie', period) +
             individu('deces_salarie', period) +
@@ -361,6 +645,16 @@ class salaire_imposable(Variable):
             )
 
 
+class salaire_imposable_annuel(Variable):
+    column = FloatCol
+    entity = Individu
+    label = u"Salaire imposable sur l'année"
+    definition_period = YEAR
+
+    def formula(individu, period, legislation):
+        return compute_salaire_imposable_par_mois(individu, period, legislation).sum(axis = 0)
+
+
 class salaire_net_a_payer(Variable):
     column = FloatCol
     entity = Individu
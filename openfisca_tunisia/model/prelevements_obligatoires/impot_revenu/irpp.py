@@ -3,9 +3,10 @@
 
 from __future__ import division
 
-from numpy import logical_or as or_, maximum as max_, minimum as min_
+from numpy import logical_or as or_, maximum as max_, minimum as min_, where
 
 from openfisca_tunisia.model.base import *  # noqa analysis:ignore
+from openfisca_tunisia.model.baremes import calculer_bareme, calculer_taux_marginal
 
 
 class nb_enf(Variable):
@@ -307,7 +308,7 @@ class revenu_assimile_salaire(Variable):
     definition_period = YEAR
 
     def formula(foyer_fiscal, period):
-        salaire_imposable = foyer_fiscal.declarant_principal('salaire_imposable', period = period, options = [ADD])
+        salaire_imposable = foyer_fiscal.declarant_principal('salaire_imposable_annuel', period = period)
         salaire_en_nature = foyer_fiscal.declarant_principal('salaire_en_nature', period = period, options = [ADD])
         return (salaire_imposable + salaire_en_nature)
 
@@ -337,7 +338,9 @@ class revenu_assimile_salaire_apres_abattements(Variable):
         smig = foyer_fiscal('smig', period = period)
         tspr = legislation(period.start).impot_revenu.tspr
 
-        if period.start.year >= 2011:
+        # La déduction SMIG s'applique aussi aux revenus inférieurs à smig_ext depuis 2011. Le noeud est lu par get :
+        # en mode trace, c'est un TracedCompactNode, qui ne gère pas l'opérateur in.
+        if tspr.get('smig_ext') is not None:
             res = max_(
                 revenu_assimile_salaire * (1 - tspr.abat_sal) - max_(smig * tspr.smig,
                  (revenu_assimile_salaire <= tspr.smig_ext) * tspr.smig), 0)
@@ -588,7 +591,7 @@ class ir_brut(Variable):
         # exemption = legislation(period.start).impot_revenu.reforme.exemption
         # rni_apres_exemption = rni * (exemption.active == 0) + rni * (exemption.active == 1) * (rni > exemption.max)
         rni_apres_exemption = rni
-        ir_brut = - bareme.calc(rni_apres_exemption)
+        ir_brut = - calculer_bareme(bareme, rni_apres_exemption)
         return ir_brut
 
 
@@ -602,3 +605,43 @@ class irpp(Variable):
         ir_brut = foyer_fiscal('ir_brut', period = period)
         irpp = ir_brut
         return irpp
+
+
+class taux_marginal_irpp(Variable):
+    column = FloatCol
+    entity = FoyerFiscal
+    label = u"Taux marginal de l'IRPP sur les revenus assimilés à des salaires"
+    definition_period = YEAR
+
+    def formula(foyer_fiscal, period, legislation):
+        '''
+        Dérivée à droite de l'impôt par rapport au revenu assimilé à des salaires, calculée analytiquement
+
+        C'est le taux de la tranche du barème où se trouve le revenu net imposable, multiplié par la pente de
+        l'abattement sur les salaires, nulle tant que le revenu après abattements est nul. Les déductions pour
+        charges de famille ne dépendent pas du revenu : elles déterminent seulement la tranche. La perte de la
+        déduction SMIG, discontinuité de l'impôt, n'est pas prise en compte.
+        '''
+        rni = foyer_fiscal('rni', period = period)
+        revenu_assimile_salaire_apres_abattements = foyer_fiscal(
+            'revenu_assimile_salaire_apres_abattements', period = period)
+        impot_revenu = legislation(period.start).impot_revenu
+        taux_bareme = calculer_taux_marginal(impot_revenu.bareme, rni)
+        pente_abattements = (1 - impot_revenu.tspr.abat_sal) * (revenu_assimile_salaire_apres_abattements > 0)
+        return taux_bareme * pente_abattements
+
+
+class taux_moyen_irpp(Variable):
+    column = FloatCol
+    entity = FoyerFiscal
+    label = u"Taux moyen de l'IRPP rapporté au revenu net global"
+    definition_period = YEAR
+
+    def formula(foyer_fiscal, period):
+        '''
+        Rapport de l'impôt au revenu net global, qui réunit les revenus de toutes les catégories du foyer fiscal
+        '''
+        irpp = foyer_fiscal('irpp', period = period)
+        rng = foyer_fiscal('rng', period = period)
+        # L'IRPP est négatif
+        return where(rng > 0, - irpp / max_(rng, 1e-6), 0)
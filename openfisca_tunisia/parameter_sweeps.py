@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+
+"""Evaluate the variables of a simulation for several candidate values of a legislation parameter in one pass.
+
+The variables affected by the parameter are computed once on the population stacked k times, the c-th copy of the
+population using the c-th candidate value: the parameter is an array with one value by row, so formulas broadcast
+over this extra axis without knowing it. The values of the other variables are copied from the simulation.
+"""
+
+
+import numpy as np
+from numpy import maximum as max_, minimum as min_
+
+from openfisca_core import periods
+from openfisca_core.commons import empty_clone
+from openfisca_core.taxscales import MarginalRateTaxScale
+
+from .reform_deltas import (calculate, find_calling_variable_name, get_inputs, get_variable_name_by_code,
+    get_variables_reading, iter_arrays)
+from .sub_simulations import get_dependency_cone
+
+
+class SweptMarginalRateTaxScale(MarginalRateTaxScale):
+    """Marginal rate tax scale whose rates and thresholds may be arrays, with one value by row of the base."""
+
+    def calc(self, base, factor = 1, round_base_decimals = None):
+        assert round_base_decimals is None, "Rounding is not supported by swept tax scales"
+        # np.finfo(np.float).eps is used, as in MarginalRateTaxScale.calc, to avoid np.nan = 0 * np.inf creation
+        factor = factor + np.finfo(np.float).eps
+        thresholds = self.thresholds + [np.inf]
+        result = np.zeros(len(base))
+        for low, high, rate in zip(thresholds[:-1], thresholds[1:], self.rates):
+            result += rate * max_(min_(base, high * factor) - low * factor, 0)
+        return result
+
+
+def split_path(path):
+    """Split the path of a swept value into the legislation path of the parameter and the bracket of a tax scale."""
+    path = tuple(path)
+    if len(path) > 2 and path[-2] in ('rates', 'thresholds') and isinstance(path[-1], int):
+        return path[:-2], path[-2:]
+    return path, None
+
+
+def replace_parameter(node, parameter_path, bracket, value):
+    """Return a copy of the legislation `node` where the parameter at `parameter_path` is replaced by `value`."""
+    key = parameter_path[0]
+    new_node = empty_clone(node)
+    new_node.__dict__ = node.__dict__.copy()
+    if len(parameter_path) > 1:
+        new_node[key] = replace_parameter(node[key], parameter_path[1:], bracket, value)
+    elif bracket is None:
+        new_node[key] = value
+    else:
+        tax_scale = node[key]
+        assert isinstance(tax_scale, MarginalRateTaxScale), \
+            "Brackets can only be swept for marginal rate tax scales, not for {}".format(tax_scale)
+        swept_tax_scale = SweptMarginalRateTaxScale(name = tax_scale.name, option = tax_scale.option,
+            unit = tax_scale.unit)
+        swept_tax_scale.thresholds = list(tax_scale.thresholds)
+        swept_tax_scale.rates = list(tax_scale.rates)
+        attribute, index = bracket
+        getattr(swept_tax_scale, attribute)[index] = value
+        new_node[key] = swept_tax_scale
+    return new_node
+
+
+def new_stacked_simulation(simulation, count, variables_name):
+    """
+    Return a simulation of the population of `simulation` stacked `count` times.
+
+    The values in the cache of `simulation` are repeated for each copy, except those of `variables_name`, which keep
+    only their inputs. The inputs of `simulation` must be known, see `record_inputs`.
+    """
+    input_arrays = get_inputs(simulation)
+    stacked_simulation = empty_clone(simulation)
+    stacked_dict = stacked_simulation.__dict__
+    for key, value in simulation.__dict__.iteritems():
+        if key not in ('debug', 'debug_all', 'trace', 'stack_trace', 'traceback', 'input_arrays', 'legislation_at',
+                'legislation_reads_by_variable_name'):
+            stacked_dict[key] = value
+    stacked_simulation.requested_periods_by_variable_name = {}
+    stacked_simulation.compact_legislation_by_instant_cache = {}
+    stacked_simulation.reference_compact_legislation_by_instant_cache = {}
+
+    stacked_simulation.entities = {}
+    for key, entity in simulation.entities.iteritems():
+        stacked_entity = empty_clone(entity)
+        stacked_entity.__dict__.update(entity.__dict__)
+        stacked_entity.simulation = stacked_simulation
+        stacked_entity._holders = {}
+        stacked_entity.count = stacked_entity.step_size = entity.count * count
+        stacked_simulation.entities[key] = stacked_entity
+        setattr(stacked_simulation, key, stacked_entity)
+    persons = stacked_simulation.persons = stacked_simulation.entities[simulation.persons.key]
+    for key, stacked_entity in stacked_simulation.entities.iteritems():
+        if stacked_entity.is_person:
+            continue
+        entity = simulation.entities[key]
+        stacked_entity.members = persons
+        stacked_entity.members_entity_id = (
+            entity.members_entity_id + entity.count * np.arange(count)[:, np.newaxis]).ravel()
+        stacked_entity.members_legacy_role = np.tile(entity.members_legacy_role, count)
+        stacked_entity.members_role = np.tile(entity.members_role, count)
+        stacked_entity._members_position = np.tile(entity.members_position, count)
+
+    for entity_key, name, period, array in iter_arrays(simulation):
+        if name not in variables_name:
+            stacked_simulation.entities[entity_key].get_holder(name).put_in_cache(np.tile(array, count), period)
+    stacked_simulation.input_arrays = [
+        (entity_key, name, period, np.tile(array, count))
+        for entity_key, name, period, array in input_arrays
+        ]
+    # The inputs of the recomputed variables are still inputs in each copy.
+    for entity_key, name, period, array in stacked_simulation.input_arrays:
+        if name in variables_name:
+            stacked_simulation.entities[entity_key].get_holder(name).put_in_cache(array, period)
+    return stacked_simulation
+
+
+def calculate_sweep(simulation, path, values, variables_name, period):
+    """
+    Compute `variables_name` for each of the candidate `values` of a legislation parameter, in one pass.
+
+    `path` is the tuple of the legislation keys of a parameter, like ('impot_revenu', 'deduc', 'fam',
+    'chef_de_famille'), or of a tax scale followed by 'rates' or 'thresholds' and the index of a bracket, like
+    ('impot_revenu', 'bareme', 'rates', 3). The candidate values replace the parameter at every date.
+
+    Only the variables depending on the parameter are computed. `simulation` should record its legislation reads,
+    see `record_legislation_reads`, and have computed `variables_name` for `period`, so that the values of the other
+    variables are reused. Monthly variables are summed over `period` when it is a year. Return, by variable name, an
+    array (number of values x number of entities).
+    """
+    period = periods.period(period)
+    values = np.asarray(values, dtype = float)
+    count = len(values)
+    parameter_path, bracket = split_path(path)
+    tax_benefit_system = simulation.tax_benefit_system
+    affected_variables = get_dependency_cone(
+        tax_benefit_system,
+        get_variables_reading(simulation, [parameter_path]),
+        )
+    stacked_simulation = new_stacked_simulation(simulation, count, affected_variables)
+
+    # The swept parameter has one value by row of the entity of the formula reading it.
+    legislation_at = stacked_simulation.legislation_at
+    variable_name_by_code = get_variable_name_by_code(tax_benefit_system)
+    legislation_by_key = {}
+
+    def swept_legislation_at(instant, reference = False):
+        legislation = legislation_at(instant, reference = reference)
+        variable_name = find_calling_variable_name(variable_name_by_code)
+        if variable_name is None:
+            return legislation
+        entity = stacked_simulation.get_variable_entity(variable_name)
+        key = (legislation.instant, reference, entity.key)
+        swept_legislation = legislation_by_key.get(key)
+        if swept_legislation is None:
+            value = np.repeat(values, entity.count // count)
+            swept_legislation = legislation_by_key[key] = replace_parameter(
+                legislation, parameter_path, bracket, value)
+        return swept_legislation
+
+    stacked_simulation.legislation_at = swept_legislation_at
+    array_by_name = {}
+    for name in variables_name:
+        array = calculate(stacked_simulation, name, period)
+        array_by_name[name] = array.reshape(count, len(array) // count)
+    return array_by_name
+
+
+def calibrate(simulation, path, target, period, bounds, variable_name = 'irpp', weights = None, precision = 1e-6,
+        candidates_count = 9, max_iterations = 50):
+    """
+    Return the value of the legislation parameter at `path` for which the weighted sum of `variable_name` over
+    `period` equals `target`, the sum being monotonic between the two `bounds` of the parameter.
+
+    Each iteration evaluates `candidates_count` values spread between the current bounds in one sweep, see
+    calculate_sweep, and keeps the two consecutive candidates around the target. The value is interpolated between
+    them once they are closer than `precision`. `weights` are the weights of the entities of `variable_name`, 1 by
+    default. `simulation` may be a simulation of a reform, to make it revenue neutral.
+    """
+    lower, upper = bounds
+    gaps = None
+    for _ in range(max_iterations):
+        candidates = np.linspace(lower, upper, candidates_count)
+        array = calculate_sweep(simulation, path, candidates, [variable_name], period)[variable_name]
+        totals = (array.astype(float) * (1 if weights is None else weights)).sum(axis = 1)
+        gaps = totals - target
+        crossings = np.flatnonzero(np.sign(gaps[:-1]) != np.sign(gaps[1:]))
+        if len(crossings) == 0:
+            raise ValueError("The weighted sum of {} doesn't reach {} for {} between {} and {}".format(
+                variable_name, target, path, lower, upper))
+        index = crossings[0]
+        lower, upper = candidates[index], candidates[index + 1]
+        gaps = gaps[index], gaps[index + 1]
+        if gaps[0] == 0:
+            return lower
+        if upper - lower < precision:
+            break
+    return lower - gaps[0] * (upper - lower) / (gaps[1] - gaps[0])
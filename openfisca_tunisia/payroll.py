@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""Compute the monthly payslips of an employer registry read from a CSV file.
+
+Employees are read and computed by chunks of fixed size, and their payslips are written as soon as their chunk is
+computed, so that memory usage does not depend on the size of the registry.
+"""
+
+
+import argparse
+import csv
+import itertools
+import logging
+import os
+import sys
+
+from openfisca_core import periods
+
+from openfisca_tunisia import TunisiaTaxBenefitSystem
+from openfisca_tunisia.model.prelevements_obligatoires.cotisations_sociales import COTISATIONS
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+payslip_variables_name = (
+    ['assiette_cotisations_sociales'] +
+    [name for name, cotisation_type, bareme_name in COTISATIONS] +
+    [
+        'ugtt',
+        'cotisations_salarie',
+        'cotisations_employeur',
+        'salaire_super_brut',
+        'salaire_imposable',
+        'salaire_net_a_payer',
+        ]
+    )
+
+
+def iter_chunks(rows, chunk_size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def compute_payslips(tax_benefit_system, rows, period, variables_name = None):
+    """
+    Compute the payslips of `rows`, dicts of strings read from CSV, for the month `period`.
+
+    The columns named after an input variable of individuals are used as inputs, the other ones are ignored.
+    Monthly inputs are assumed to be paid every month of the year, so that the income tax withheld from
+    `salaire_net_a_payer` is the monthly share of the income tax of this salary over a year.
+    Return an array by variable name.
+    """
+    if variables_name is None:
+        variables_name = payslip_variables_name
+    period = periods.period(period)
+    assert period.unit == periods.MONTH, "Payslips are computed for a month, not for {}".format(period)
+
+    input_variables = {}
+    for name in rows[0].iterkeys():
+        column = tax_benefit_system.column_by_name.get(name)
+        if column is None or not column.is_input_variable() or not column.entity.is_person:
+            continue
+        input_variables[name] = {
+            period: [
+                row[name] if row[name] != '' else column.default
+                for row in rows
+                ],
+            }
+    simulation = tax_benefit_system.new_scenario().init_from_attributes(
+        period = period,
+        input_variables = input_variables,
+        ).new_simulation()
+
+    for name in input_variables:
+        holder = simulation.persons.get_holder(name)
+        if holder.column.definition_period != periods.MONTH:
+            continue
+        array = holder.get_array(period)
+        first_month = period.this_year.first_month
+        for index in range(12):
+            month = first_month.offset(index, periods.MONTH)
+            if month != period:
+                holder.put_in_cache(array, month)
+
+    return dict(
+        (name, simulation.calculate(name, period))
+        for name in variables_name
+        )
+
+
+def iter_payslips(tax_benefit_system, rows, period, chunk_size = 10000, variables_name = None):
+    """Yield the payslip of each row: the row with the values of `variables_name` added, computed by chunks."""
+    if variables_name is None:
+        variables_name = payslip_variables_name
+    for chunk in iter_chunks(rows, chunk_size):
+        array_by_name = compute_payslips(tax_benefit_system, chunk, period, variables_name = variables_name)
+        for index, row in enumerate(chunk):
+            payslip = row.copy()
+            for name in variables_name:
+                payslip[name] = array_by_name[name][index]
+            yield payslip
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('input_file', help = "CSV file of the employees, one row by employee")
+    parser.add_argument('output_file', help = "CSV file of the payslips")
+    parser.add_argument('-p', '--period', required = True, help = "month of the payslips, for example 2016-04")
+    parser.add_argument('-c', '--chunk-size', default = 10000, type = int,
+        help = "number of employees computed at once")
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    tax_benefit_system = TunisiaTaxBenefitSystem()
+    with open(args.input_file, 'rb') as input_file, open(args.output_file, 'wb') as output_file:
+        reader = csv.DictReader(input_file)
+        writer = csv.DictWriter(output_file, reader.fieldnames + payslip_variables_name)
+        writer.writeheader()
+        count = 0
+        for payslip in iter_payslips(tax_benefit_system, reader, args.period, chunk_size = args.chunk_size):
+            for name in payslip_variables_name:
+                payslip[name] = '{:.3f}'.format(payslip[name] + 0)  # No negative zero
+            writer.writerow(payslip)
+            count += 1
+        log.info(u'{} payslips written to {}'.format(count, args.output_file))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+
+"""Evaluate the situation of a scenario under the legislations of several years in one pass.
+
+The population is stacked once by year, see `new_stacked_simulation`, and computed for the period of the scenario:
+the c-th copy uses the legislation of the c-th year. Parameters whose values differ between the years are arrays
+with one value by row, so formulas run once over the (years x entities) rows. Years whose legislations don't have the
+same parameters and brackets are stacked separately.
+"""
+
+
+import collections
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.commons import empty_clone
+from openfisca_core.legislations import CompactNode
+from openfisca_core.taxscales import AbstractTaxScale, MarginalRateTaxScale
+
+from .parameter_sweeps import SweptMarginalRateTaxScale, new_stacked_simulation
+from .reform_deltas import (calculate, find_calling_variable_name, get_variable_name_by_code, node_attributes_name,
+    record_inputs)
+
+
+def get_structure(node):
+    """Return the structure of a legislation: the paths of its parameters, with the number of brackets of scales."""
+    structure = set()
+    for key, value in node.__dict__.iteritems():
+        if key in node_attributes_name:
+            continue
+        if isinstance(value, CompactNode):
+            structure.update((key,) + path for path in get_structure(value))
+        elif isinstance(value, AbstractTaxScale):
+            structure.add((key, len(value.thresholds)))
+        else:
+            structure.add((key,))
+    return frozenset(structure)
+
+
+def stack_values(values, repeat):
+    if all(value == values[0] for value in values[1:]):
+        return values[0]
+    return np.repeat(np.array(values), repeat)
+
+
+def stack_legislations(nodes, repeat):
+    """
+    Return the legislation whose parameters are those of `nodes`, repeated `repeat` times each, when they differ.
+    """
+    first_node = nodes[0]
+    if isinstance(first_node, CompactNode):
+        stacked_node = empty_clone(first_node)
+        stacked_node.__dict__ = first_node.__dict__.copy()
+        for key, value in first_node.__dict__.iteritems():
+            if key not in node_attributes_name:
+                stacked_node[key] = stack_legislations([node[key] for node in nodes], repeat)
+        return stacked_node
+    if isinstance(first_node, AbstractTaxScale):
+        if all(node.__dict__ == first_node.__dict__ for node in nodes[1:]):
+            return first_node
+        if not isinstance(first_node, MarginalRateTaxScale):
+            raise ValueError("Tax scale {} changes between the years, it can't be stacked".format(first_node.name))
+        stacked_tax_scale = SweptMarginalRateTaxScale(name = first_node.name, option = first_node.option,
+            unit = first_node.unit)
+        stacked_tax_scale.thresholds = [
+            stack_values(thresholds, repeat)
+            for thresholds in zip(*[node.thresholds for node in nodes])
+            ]
+        stacked_tax_scale.rates = [
+            stack_values(rates, repeat)
+            for rates in zip(*[node.rates for node in nodes])
+            ]
+        return stacked_tax_scale
+    return stack_values(nodes, repeat)
+
+
+def group_years(tax_benefit_system, years):
+    """Group `years` by structure of their legislations at the start of the year, keeping their order."""
+    years_by_structure = collections.OrderedDict()
+    for year in years:
+        structure = get_structure(tax_benefit_system.get_compact_legislation(periods.instant(year)))
+        years_by_structure.setdefault(structure, []).append(year)
+    return years_by_structure.values()
+
+
+def calculate_years(simulation, variables_name, period, years):
+    """
+    Compute `variables_name` over `period` for the population of `simulation` stacked once by year of `years`, the
+    copy of each year using the legislation of this year.
+
+    The legislations of `years` must have the same parameters and brackets, and the inputs of `simulation` must be
+    recorded, see record_inputs. Return, by variable name, an array (number of years x number of entities).
+    """
+    count = len(years)
+    reference_year = period.start.year
+    stacked_simulation = new_stacked_simulation(simulation, count, [])
+    legislation_at = stacked_simulation.legislation_at
+    variable_name_by_code = get_variable_name_by_code(simulation.tax_benefit_system)
+    legislation_by_key = {}
+
+    def stacked_legislation_at(instant, reference = False):
+        variable_name = find_calling_variable_name(variable_name_by_code)
+        if variable_name is None:
+            return legislation_at(instant, reference = reference)
+        # Parameters have one value by row of the entity of the formula reading them.
+        entity = stacked_simulation.get_variable_entity(variable_name)
+        key = (instant, reference, entity.key)
+        stacked_legislation = legislation_by_key.get(key)
+        if stacked_legislation is None:
+            legislations = [
+                legislation_at(instant.offset(year - reference_year, periods.YEAR), reference = reference)
+                for year in years
+                ]
+            if len(set(get_structure(legislation) for legislation in legislations)) > 1:
+                raise ValueError("The legislations of {} at {} don't have the same parameters".format(
+                    years, instant))
+            stacked_legislation = legislation_by_key[key] = stack_legislations(legislations, entity.count // count)
+        return stacked_legislation
+
+    stacked_simulation.legislation_at = stacked_legislation_at
+    array_by_name = collections.OrderedDict()
+    for name in variables_name:
+        array = calculate(stacked_simulation, name, period)
+        array_by_name[name] = array.reshape(count, len(array) // count)
+    return array_by_name
+
+
+def calculate_projection(scenario, variables_name, years):
+    """
+    Compute `variables_name` for the situation of `scenario`, with its inputs for its period, under the legislation
+    of each year of `years`.
+
+    Variables are computed over the year of the scenario period, monthly variables being summed. Years are stacked
+    by groups of legislations with the same parameters. Return, by variable name, an array (number of years x
+    number of entities).
+    """
+    period = periods.period(scenario.period).this_year
+    tax_benefit_system = scenario.tax_benefit_system
+    array_by_name = collections.OrderedDict()
+    row_by_year = {}
+    for group in group_years(tax_benefit_system, years):
+        simulation = scenario.new_simulation()
+        record_inputs(simulation)
+        group_array_by_name = calculate_years(simulation, variables_name, period, group)
+        for name, array in group_array_by_name.iteritems():
+            array_by_name.setdefault(name, []).append(array)
+        start = len(row_by_year)
+        row_by_year.update((year, start + index) for index, year in enumerate(group))
+    order = [row_by_year[year] for year in years]
+    return collections.OrderedDict(
+        (name, np.concatenate(arrays)[order])
+        for name, arrays in array_by_name.iteritems()
+        )
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+
+
+"""Evaluate a reform by recomputing only the variables affected by the parameters and formulas it changes.
+
+A baseline simulation records the legislation paths read by each formula. Variables reading a parameter changed by
+the reform, or whose formula the reform replaces, are recomputed with their dependants; the holders of all the other
+variables, inputs included, are shared with the baseline simulation.
+"""
+
+
+import collections
+import sys
+import types
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.legislations import CompactNode
+
+from .sub_simulations import get_dependency_cone, iter_codes, new_sub_simulation
+
+
+# Keys of CompactNode.__dict__ which are not parameters
+node_attributes_name = ('instant', 'name')
+
+
+class RecordingNode(object):
+    """Proxy of a CompactNode which records the paths of the parameters read through it."""
+
+    def __init__(self, node, path, reads):
+        self.__dict__['_node'] = node
+        self.__dict__['_path'] = path
+        self.__dict__['_reads'] = reads
+
+    def _child(self, key, value):
+        path = self._path + (key,)
+        if isinstance(value, CompactNode):
+            return RecordingNode(value, path, self._reads)
+        self._reads.add(path)
+        return value
+
+    def _read_all(self):
+        # The node escapes the proxy (iteration, hashing...): all its parameters may be read.
+        self._reads.add(self._path)
+        return self._node
+
+    def __getattr__(self, key):
+        node = self._node
+        if key in node_attributes_name:
+            return getattr(node, key)
+        if key in node.__dict__:
+            return self._child(key, node.__dict__[key])
+        return getattr(self._read_all(), key)
+
+    def __getitem__(self, key):
+        return self._child(key, self._node[key])
+
+    def __contains__(self, key):
+        self._reads.add(self._path + (key,))
+        return key in self._node.__dict__
+
+    def __iter__(self):
+        return iter(self._read_all())
+
+    def __eq__(self, other):
+        if isinstance(other, RecordingNode):
+            other = other._node
+        return self._read_all() is other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        # Lets caches keyed by legislation nodes, like the tables of contributions scales, find the proxied node.
+        return hash(self._read_all())
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self._node)
+
+    def get(self, key, default = None):
+        value = self._node.get(key, default)
+        if key not in self._node.__dict__:
+            self._reads.add(self._path + (key,))
+            return value
+        return self._child(key, value)
+
+
+def get_variable_name_by_code(tax_benefit_system):
+    variable_name_by_code = {}
+    for name, column in tax_benefit_system.column_by_name.iteritems():
+        formula_class = column.formula_class
+        if formula_class is None:
+            continue
+        for dated_formula_class in formula_class.dated_formulas_class:
+            variable_name_by_code[dated_formula_class['formula_class'].formula.im_func.func_code] = name
+    return variable_name_by_code
+
+
+def get_static_reads(function, roots_name):
+    """
+    Return the legislation roots, as paths of length 1, that `function` and the module-level functions it calls may
+    read.
+
+    Formulas reach the legislation roots by literal names: these names are an upper bound of the roots read.
+    """
+    reads = set()
+    functions = [function]
+    visited_functions = set()
+    while functions:
+        function = functions.pop()
+        if function in visited_functions:
+            continue
+        visited_functions.add(function)
+        for code in iter_codes(function.func_code):
+            constants = tuple(constant for constant in code.co_consts if isinstance(constant, basestring))
+            for name in code.co_names + constants:
+                if name in roots_name:
+                    reads.add((name,))
+                value = function.func_globals.get(name)
+                if isinstance(value, types.FunctionType):
+                    functions.append(value)
+    return reads
+
+
+def iter_arrays(simulation):
+    """Yield the entity key, the variable name, the period and the array of every value in the cache of `simulation`."""
+    for entity in simulation.entities.itervalues():
+        for name, holder in entity._holders.iteritems():
+            if holder._array is not None:
+                yield entity.key, name, None, holder._array
+            for period, array in (holder._array_by_period or {}).iteritems():
+                if period is not None and isinstance(array, np.ndarray):
+                    yield entity.key, name, period, array
+
+
+def record_inputs(simulation):
+    """
+    Keep the values in the cache of `simulation` as its inputs: the simulations derived from it give them again to the
+    variables they recompute.
+
+    Call it on the new simulation, before anything is computed. record_legislation_reads calls it when the inputs
+    aren't recorded yet.
+    """
+    simulation.input_arrays = list(iter_arrays(simulation))
+
+
+def get_inputs(simulation):
+    """Return the entity key, the variable name, the period and the array of every input of `simulation`."""
+    input_arrays = getattr(simulation, 'input_arrays', None)
+    if input_arrays is None:
+        raise ValueError("The inputs of the simulation are unknown: call record_inputs or record_legislation_reads "
+            "on the new simulation, before computing anything")
+    return input_arrays
+
+
+def find_calling_variable_name(variable_name_by_code):
+    """
+    Return the name of the variable of the innermost formula in the call stack, or None outside formulas.
+
+    The whole stack is walked, so the helpers, decorators and core functions between the formula and the caller don't
+    matter.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        variable_name = variable_name_by_code.get(frame.f_code)
+        if variable_name is not None:
+            return variable_name
+        frame = frame.f_back
+    return None
+
+
+def record_legislation_reads(simulation):
+    """
+    Record, from now on, the legislation paths read by each formula computed by `simulation`.
+
+    Paths are tuples of legislation keys, stored by variable name in `simulation.legislation_reads_by_variable_name`.
+    A path may be a node whose parameters are all considered read. Legislation nodes are proxied, so that the paths
+    read by module-level helpers, and by sub-simulations, are recorded too. Paths read outside any formula of the
+    call stack are recorded under None: they can't be assigned to a variable, so get_variables_reading then falls back
+    to the static bound of the reads of every variable.
+
+    When the inputs of the simulation aren't known yet, the values already in cache are kept as its inputs, see
+    record_inputs.
+    """
+    assert not simulation.trace, "Legislation reads can't be recorded in trace mode"
+    if getattr(simulation, 'input_arrays', None) is None:
+        record_inputs(simulation)
+    legislation_at = simulation.legislation_at
+    variable_name_by_code = get_variable_name_by_code(simulation.tax_benefit_system)
+    reads_by_variable_name = simulation.legislation_reads_by_variable_name = {}
+
+    def recording_legislation_at(instant, reference = False):
+        legislation = legislation_at(instant, reference = reference)
+        variable_name = find_calling_variable_name(variable_name_by_code)
+        reads = reads_by_variable_name.setdefault(variable_name, set())
+        return RecordingNode(legislation, (), reads)
+
+    simulation.legislation_at = recording_legislation_at
+
+
+def iter_changed_parameters(reference_node_json, node_json, path = ()):
+    if reference_node_json.get('@type') != u'Node' or node_json.get('@type') != u'Node':
+        if reference_node_json != node_json:
+            yield path
+        return
+    reference_children = reference_node_json['children']
+    children = node_json['children']
+    for key in set(reference_children) | set(children):
+        if key not in reference_children or key not in children:
+            yield path + (key,)
+        else:
+            for changed_path in iter_changed_parameters(reference_children[key], children[key], path + (key,)):
+                yield changed_path
+
+
+def get_changed_parameters(tax_benefit_system, reform):
+    """Return the paths of the parameters or nodes which differ, at any date, between two legislations."""
+    return set(iter_changed_parameters(tax_benefit_system.get_legislation(), reform.get_legislation()))
+
+
+def is_prefix(path, other_path):
+    return other_path[:len(path)] == path
+
+
+def get_affected_variables(simulation, reform):
+    """
+    Return the names of the variables whose values may differ between `simulation` and the same simulation under
+    `reform`.
+
+    These are the variables whose formulas are replaced by `reform`, those reading a changed parameter, and all the
+    variables depending on them. The reads recorded by `simulation` are used when available; they are valid for the
+    periods computed by `simulation`, so the reform should be evaluated on the same periods.
+    """
+    column_by_name = simulation.tax_benefit_system.column_by_name
+    changed_variables = set(
+        name
+        for name in set(column_by_name) | set(reform.column_by_name)
+        if column_by_name.get(name) is not reform.column_by_name.get(name)
+        )
+    changed_parameters = get_changed_parameters(simulation.tax_benefit_system, reform)
+    changed_variables.update(get_variables_reading(simulation, changed_parameters))
+    return get_dependency_cone(reform, changed_variables)
+
+
+def get_variables_reading(simulation, parameters):
+    """
+    Return the names of the variables of `simulation` whose formulas may read one of the legislation paths
+    `parameters`.
+
+    The reads recorded by `simulation` are used when available, and when all of them could be assigned to a variable.
+    """
+    tax_benefit_system = simulation.tax_benefit_system
+    reads_by_variable_name = getattr(simulation, 'legislation_reads_by_variable_name', {})
+    if reads_by_variable_name.get(None):
+        # Parameters were read outside any formula found in the call stack: the reads recorded for some variables may
+        # miss them.
+        reads_by_variable_name = {}
+    roots_name = set(tax_benefit_system.get_legislation()['children'])
+    variables_name = set()
+    for name, column in tax_benefit_system.column_by_name.iteritems():
+        if column.formula_class is None:
+            continue
+        reads = reads_by_variable_name.get(name)
+        if reads is None:
+            # Variables computed without recording their reads, for example put in cache by the formula of another
+            # variable, may read any parameter under the legislation roots their formulas name.
+            reads = set()
+            for dated_formula_class in column.formula_class.dated_formulas_class:
+                reads.update(get_static_reads(dated_formula_class['formula_class'].formula.im_func, roots_name))
+        if any(is_prefix(read, parameter) or is_prefix(parameter, read)
+                for read in reads
+                for parameter in parameters):
+            variables_name.add(name)
+    return variables_name
+
+
+def new_reform_simulation(simulation, reform):
+    """
+    Return a simulation of `reform` sharing with `simulation` the holders of the variables the reform doesn't affect.
+
+    `simulation` should record its legislation reads, see `record_legislation_reads`, from its creation: the more
+    baseline variables are computed, the more values the reform simulation reuses. Its inputs must be known, see
+    record_inputs.
+    """
+    input_arrays = get_inputs(simulation)
+    affected_variables = get_affected_variables(simulation, reform)
+    reform_simulation = new_sub_simulation(simulation, affected_variables)
+    reform_dict = reform_simulation.__dict__
+    for key in ('legislation_at', 'legislation_reads_by_variable_name'):
+        reform_dict.pop(key, None)
+    reform_simulation.tax_benefit_system = reform
+    reform_simulation.compact_legislation_by_instant_cache = {}
+    reform_simulation.reference_compact_legislation_by_instant_cache = {}
+    # The inputs of the recomputed variables are still inputs under the reform.
+    for entity_key, name, period, array in input_arrays:
+        if name in affected_variables:
+            reform_simulation.entities[entity_key].get_holder(name).put_in_cache(array, period)
+    return reform_simulation
+
+
+def freeze_arrays(simulation):
+    """Make the arrays in the cache of `simulation` read-only, so that simulations sharing them can't modify them."""
+    for entity_key, name, period, array in iter_arrays(simulation):
+        array.flags.writeable = False
+
+
+def calculate(simulation, name, period):
+    column = simulation.tax_benefit_system.get_column(name, check_existence = True)
+    if column.definition_period == periods.MONTH and period.unit == periods.YEAR:
+        return simulation.calculate_add(name, period)
+    return simulation.calculate(name, period)
+
+
+def calculate_paired(scenario, reform, variables_name, period):
+    """
+    Compute `variables_name` for the situation of `scenario` under its tax-benefit system and under `reform`.
+
+    Inputs are converted once, into read-only arrays that both simulations share, and the reform only recomputes
+    the variables it affects. Monthly variables are summed over `period` when it is a year. Return the values by
+    variable name for the baseline and for the reform.
+    """
+    period = periods.period(period)
+    simulation = scenario.new_simulation()
+    record_legislation_reads(simulation)
+    freeze_arrays(simulation)
+    baseline_by_name = collections.OrderedDict(
+        (name, calculate(simulation, name, period))
+        for name in variables_name
+        )
+    reform_simulation = new_reform_simulation(simulation, reform)
+    reform_by_name = collections.OrderedDict(
+        (name, calculate(reform_simulation, name, period))
+        for name in variables_name
+        )
+    return baseline_by_name, reform_by_name
+
+
+def calculate_differences(scenario, reform, variables_name, period):
+    """Return, by variable name, the array of the differences reform - baseline of each entity, see calculate_paired."""
+    baseline_by_name, reform_by_name = calculate_paired(scenario, reform, variables_name, period)
+    return collections.OrderedDict(
+        (name, reform_by_name[name] - baseline_by_name[name])
+        for name in variables_name
+        )
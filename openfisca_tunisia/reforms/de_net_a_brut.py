@@ -2,36 +2,227 @@
 
 from __future__ import division
 
-from openfisca_tunisia.model.base import *
+import collections
+
+from numpy import abs as abs_, array, float64, maximum as max_, searchsorted, where, zeros
 
-try:
-    from scipy.optimize import fsolve
-except ImportError:
-    fsolve = None
+from openfisca_tunisia.model.base import *
 
 from .. import entities
+from ..sub_simulations import new_sub_simulation
+
+
+# Variables du calcul salaire imposable -> salaire net dont l'inversion analytique reproduit les formules.
+# Si une réforme composée avec celle-ci en remplace une, on se rabat sur l'inversion numérique.
+VARIABLES_INVERSEES = [
+    'ir_brut',
+    'irpp',
+    'revenu_assimile_salaire',
+    'revenu_assimile_salaire_apres_abattements',
+    'rng',
+    'rni',
+    'salaire_imposable_annuel',
+    'salaire_net_a_payer',
+    'smig',
+    'tspr',
+    ]
+
+
+TAILLE_MAX_TABLES_INVERSION = 64
+tables_inversion = collections.OrderedDict()
+
+
+def formules_de_reference(tax_benefit_system):
+    base_tax_benefit_system = tax_benefit_system.base_tax_benefit_system
+    return all(
+        tax_benefit_system.get_column(name) is base_tax_benefit_system.get_column(name)
+        for name in VARIABLES_INVERSEES
+        )
+
+
+def mois_de_l_annee(period):
+    first_month = period.this_year.first_month
+    return [first_month.offset(index, MONTH) for index in range(12)]
+
+
+def sous_simulation(simulation, period, array_by_variable_name):
+    """
+    Sous-simulation où les variables mensuelles de `array_by_variable_name` prennent la valeur donnée chaque mois
+    de l'année de `period`
+
+    Seules les variables qui en dépendent, dont `salaire_net_a_payer`, sont recalculées.
+    """
+    temp_simulation = new_sub_simulation(simulation, array_by_variable_name.keys())
+    individus = temp_simulation.persons
+    for name, value in array_by_variable_name.iteritems():
+        holder = individus.get_holder(name)
+        value = value.astype(holder.column.dtype)
+        for month in mois_de_l_annee(period):
+            holder.put_in_cache(value, month)
+    return temp_simulation
+
+
+def calculate_net_from(salaire_imposable, simulation, period):
+    temp_simulation = sous_simulation(simulation, period, dict(salaire_imposable = salaire_imposable))
+    return temp_simulation.calculate('salaire_net_a_payer', period)
+
 
+def resoudre(fonction, cible, depart, precision = 1e-3, max_iterations = 100):
+    """
+    Résout `fonction(x) = cible` ligne à ligne, pour une fonction vectorisée croissante
 
-def calculate_net_from(salaire_imposable, simulation, period, requested_variable_names):
-    # We're not wanting to calculate salaire_imposable again, but instead manually set it as an input variable
-    # To avoid possible conflicts, remove its function
-    simulation.holder_by_name['salaire_imposable'].formula.function = None
-    simulation.get_or_new_holder('salaire_imposable').array = salaire_imposable
+    Encadre la solution de chaque ligne à partir de `depart`, puis resserre l'encadrement par la méthode de la
+    fausse position (variante Illinois). Chaque itération évalue `fonction` une seule fois sur toute la population ;
+    les lignes où l'écart est inférieur à `precision`, ou l'encadrement plus étroit que `precision`, sont figées.
+    """
+    inferieur = depart.astype(float64)
+    ecart_inferieur = fonction(inferieur) - cible
+    pas = max_(abs_(cible) / 4, 1)
+    superieur = inferieur + pas
+    ecart_superieur = fonction(superieur) - cible
 
-    # Work in isolation
-    temp_simulation = simulation.clone()
+    # Décale l'encadrement, en doublant le pas, sur les lignes où la solution n'est pas entre les bornes
+    for _ in range(max_iterations):
+        trop_haut = ecart_inferieur > 0
+        trop_bas = ecart_superieur < 0
+        a_decaler = trop_haut | trop_bas
+        if not a_decaler.any():
+            break
+        pas = where(a_decaler, 2 * pas, pas)
+        essai = where(trop_haut, inferieur - pas, where(trop_bas, superieur + pas, inferieur))
+        ecart = fonction(essai) - cible
+        superieur, ecart_superieur, inferieur, ecart_inferieur = (
+            where(trop_haut, inferieur, where(trop_bas, essai, superieur)),
+            where(trop_haut, ecart_inferieur, where(trop_bas, ecart, ecart_superieur)),
+            where(trop_haut, essai, where(trop_bas, superieur, inferieur)),
+            where(trop_haut, ecart, where(trop_bas, ecart_superieur, ecart_inferieur)),
+            )
+    else:
+        raise ValueError(u"Impossible d'encadrer la solution en {} itérations".format(max_iterations).encode('utf-8'))
 
-    # Calculated variable holders might contain undesired cache
-    # (their entity.simulation points to the original simulation above)
-    for name in requested_variable_names:
-        del temp_simulation.holder_by_name[name]
+    solution = where(abs_(ecart_inferieur) <= abs_(ecart_superieur), inferieur, superieur)
+    convergee = (
+        (abs_(ecart_inferieur) < precision) | (abs_(ecart_superieur) < precision) |
+        (superieur - inferieur < precision)
+        )
+    # Dernière borne déplacée : -1 pour l'inférieure, 1 pour la supérieure
+    dernier_cote = zeros(len(solution))
+    for _ in range(max_iterations):
+        active = ~convergee
+        if not active.any():
+            break
+        denominateur = where(active, ecart_superieur - ecart_inferieur, 1)
+        essai = where(active, superieur - ecart_superieur * (superieur - inferieur) / denominateur, solution)
+        ecart = fonction(essai) - cible
+        solution = essai
+        au_dessus = active & (ecart > 0)
+        en_dessous = active & (ecart <= 0)
+        # Illinois : divise par deux l'écart de la borne qui n'a pas bougé deux fois de suite
+        ecart_inferieur = where(au_dessus & (dernier_cote == 1), ecart_inferieur / 2, ecart_inferieur)
+        ecart_superieur = where(en_dessous & (dernier_cote == -1), ecart_superieur / 2, ecart_superieur)
+        superieur = where(au_dessus, essai, superieur)
+        ecart_superieur = where(au_dessus, ecart, ecart_superieur)
+        inferieur = where(en_dessous, essai, inferieur)
+        ecart_inferieur = where(en_dessous, ecart, ecart_inferieur)
+        dernier_cote = where(au_dessus, 1, where(en_dessous, -1, dernier_cote))
+        convergee |= active & ((abs_(ecart) < precision) | (superieur - inferieur < precision))
+    return solution
 
-    # Force recomputing of salaire_net
-    del temp_simulation.holder_by_name['salaire_net_a_payer']
 
-    net = temp_simulation.calculate('salaire_net_a_payer', period)[0]
+def get_table_inversion(bareme, abattement):
+    """
+    Table de G(rni) = rni / abattement - impot(rni) aux seuils du barème : valeurs et pentes à droite de chaque seuil
 
-    return net
+    Pour un revenu assimilé à des salaires R au-delà du seuil d'annulation de l'abattement, le revenu net imposable
+    vaut rni = rni_hors_salaires + abattement * R - deduction, et le revenu après impôt R - impot(rni) vaut
+    G(rni) + (deduction - rni_hors_salaires) / abattement. La situation du foyer ne fait que translater G : une
+    seule table, exacte, sert à tous les foyers pour un même barème. Les tables sont gardées dans un cache LRU.
+    """
+    cle = (abattement, tuple(bareme.thresholds), tuple(bareme.rates))
+    table = tables_inversion.pop(cle, None)
+    if table is None:
+        seuils = array(bareme.thresholds, dtype = float64)
+        table = (seuils, seuils / abattement - bareme.calc(seuils), 1 / abattement - array(bareme.rates))
+        if len(tables_inversion) >= TAILLE_MAX_TABLES_INVERSION:
+            tables_inversion.popitem(last = False)
+    tables_inversion[cle] = table
+    return table
+
+
+def evaluer_table(table, abattement, rni):
+    seuils, valeurs, pentes = table
+    index = searchsorted(seuils, rni, side = 'right') - 1
+    # Sous le premier seuil, l'impôt est nul
+    return where(
+        index < 0,
+        valeurs[0] + (rni - seuils[0]) / abattement,
+        valeurs[max_(index, 0)] + (rni - seuils[max_(index, 0)]) * pentes[max_(index, 0)],
+        )
+
+
+def inverser_table(table, abattement, valeur):
+    seuils, valeurs, pentes = table
+    index = searchsorted(valeurs, valeur, side = 'right') - 1
+    return where(
+        index < 0,
+        seuils[0] + (valeur - valeurs[0]) * abattement,
+        seuils[max_(index, 0)] + (valeur - valeurs[max_(index, 0)]) / pentes[max_(index, 0)],
+        )
+
+
+def inverser_bareme(revenu_net, rni_hors_salaires, deduction, legislation):
+    """
+    Revenu assimilé à des salaires annuel dont le revenu après impôt vaut `revenu_net`, la déduction SMIG
+    `deduction` étant appliquée quel que soit le revenu
+    """
+    tspr = legislation.impot_revenu.tspr
+    abattement = 1 - tspr.abat_sal
+    table = get_table_inversion(legislation.impot_revenu.bareme, abattement)
+    translation = (deduction - rni_hors_salaires) / abattement
+    rni = inverser_table(table, abattement, revenu_net - translation)
+    # En deçà du seuil d'annulation de l'abattement, le revenu net imposable vaut rni_hors_salaires
+    impot_hors_salaires = rni_hors_salaires / abattement - evaluer_table(table, abattement, rni_hors_salaires)
+    return where(
+        rni < rni_hors_salaires,
+        revenu_net + impot_hors_salaires,
+        (rni - rni_hors_salaires + deduction) / abattement,
+        )
+
+
+def inverser_revenu_assimile_salaire(revenu_net, rni_hors_salaires, smig_dec, legislation):
+    """
+    Revenu assimilé à des salaires annuel dont le revenu après impôt vaut `revenu_net`
+
+    Inverse revenu_assimile_salaire_apres_abattements, rni et ir_brut.
+    """
+    tspr = legislation.impot_revenu.tspr
+    seuil_smig = 12 * legislation.cotisations_sociales.gen.smig_40h_mensuel
+    # Comme dans revenu_assimile_salaire_apres_abattements, la déduction SMIG s'étend jusqu'à smig_ext quand la
+    # législation le définit
+    if tspr.get('smig_ext') is not None:
+        seuil_smig = max(seuil_smig, tspr.smig_ext)
+
+    revenu_avec_deduction = inverser_bareme(revenu_net, rni_hors_salaires, tspr.smig, legislation)
+    revenu_sans_deduction = inverser_bareme(revenu_net, rni_hors_salaires, 0, legislation)
+    # Le revenu après impôt baisse au seuil de perte de la déduction SMIG : on retient alors le plus petit antécédent
+    return where(
+        smig_dec | (revenu_avec_deduction <= seuil_smig),
+        revenu_avec_deduction,
+        revenu_sans_deduction,
+        )
+
+
+class rni_hors_salaires(Variable):
+    column = FloatCol
+    entity = FoyerFiscal
+    label = u"Revenu net imposable en l'absence de revenus assimilés à des salaires"
+    definition_period = YEAR
+
+    def formula(foyer_fiscal, period):
+        simulation = foyer_fiscal.simulation
+        zero = simulation.persons.filled_array(0)
+        temp_simulation = sous_simulation(simulation, period, dict(salaire_en_nature = zero, salaire_imposable = zero))
+        return temp_simulation.calculate('rni', period)
 
 
 class salaire_imposable(Variable):
@@ -40,36 +231,37 @@ class salaire_imposable(Variable):
     label = u"Salaire imposable"
     definition_period = MONTH
 
-    def formula(self, simulation, period):
-        # Calcule le salaire brut à partir du salaire net par inversion numérique.
-        net = simulation.get_array('salaire_net_a_payer', period)
-        assert net is not None
-        simulation = self.holder.entity.simulation
-
-        # List of variables already calculated. We will need it to remove their holders,
-        # that might contain undesired cache
-        requested_variable_names = simulation.requested_periods_by_variable_name.keys()
-        if requested_variable_names:
-            requested_variable_names.remove(u'salaire_imposable')
-        # Clean 'requested_periods_by_variable_name', that is used by -core to check for computation cycles.
-        # This variable, salaire_imposable, might have been called from variable X,
-        # that will be calculated again in our iterations to compute the salaire_net requested
-        # as an input variable, hence producing a cycle error
-        simulation.requested_periods_by_variable_name = dict()
-
-        def solve_func(net):
-            def innerfunc(essai):
-                return calculate_net_from(essai, simulation, period, requested_variable_names) - net
-            return innerfunc
-
-        brut_calcule = \
-            fsolve(
-                solve_func(net),
-                net * 1.25,  # on entend souvent parler cette méthode...
-                xtol = 1 / 100  # précision
-                )
-
-        return brut_calcule
+    def formula(individu, period, legislation):
+        if not formules_de_reference(individu.simulation.tax_benefit_system):
+            return salaire_imposable_numerique(individu, period)
+
+        # Calcule le salaire imposable à partir du salaire net par inversion analytique du barème de l'impôt,
+        # le salaire du mois étant supposé versé toute l'année
+        annee = period.this_year
+        salaire_net_a_payer = individu('salaire_net_a_payer', period)
+        foyer_fiscal = individu.foyer_fiscal
+        revenu_net = 12 * (
+            foyer_fiscal.declarant_principal('salaire_net_a_payer', period) +
+            foyer_fiscal.declarant_principal('salaire_en_nature', period)
+            )
+        rni_hors_salaires = foyer_fiscal('rni_hors_salaires', annee)
+        smig_dec = foyer_fiscal.declarant_principal('smig_dec', annee.first_month)
+        revenu_assimile_salaire = inverser_revenu_assimile_salaire(
+            revenu_net, rni_hors_salaires, smig_dec, legislation(annee.start))
+        irpp = revenu_assimile_salaire - revenu_net
+        return salaire_net_a_payer + irpp / 12
+
+
+def salaire_imposable_numerique(individu, period):
+    # Calcule le salaire imposable à partir du salaire net par inversion numérique, l'impôt étant négatif ou nul
+    # le salaire net est un minorant
+    net = individu('salaire_net_a_payer', period)
+    simulation = individu.simulation
+    return resoudre(
+        lambda essai: calculate_net_from(essai, simulation, period),
+        net,
+        depart = net,
+        )
 
 
 class de_net_a_brut(Reform):
@@ -77,3 +269,4 @@ class de_net_a_brut(Reform):
 
     def apply(self):
         self.update_variable(salaire_imposable)
+        self.add_variable(rni_hors_salaires)
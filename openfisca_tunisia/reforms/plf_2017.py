@@ -12,7 +12,7 @@ def modify_legislation_json(reference_legislation_json_copy):
 
     reference_legislation_json_copy = update_legislation(
         legislation_json = reference_legislation_json_copy,
-        path = ('children', 'ir', 'children', 'bareme', 'brackets', 3, 'rate'),
+        path = ('children', 'impot_revenu', 'children', 'bareme', 'brackets', 3, 'rate'),
         period = reform_period,
         value = .27,
         )
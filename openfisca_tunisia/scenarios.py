@@ -7,8 +7,9 @@ import itertools
 import logging
 import re
 import uuid
+import weakref
 
-from openfisca_core import conv, scenarios
+from openfisca_core import conv, periods, scenarios
 from entities import Individu, FoyerFiscal, Menage
 
 
@@ -58,6 +59,27 @@ class Scenario(scenarios.AbstractScenario):
             ))
         return self
 
+    def init_from_trusted_test_case(self, period, test_case, check = True):
+        """Set the test case of the scenario without its conversion pipeline, for test cases validated upstream.
+
+        Values must already be Python values of the type of their variable, or dicts of these values keyed by
+        periods.Period objects, not by strings. Entities must have ids and every individual must belong to one foyer
+        fiscal and one ménage, each foyer fiscal having a declarant and each ménage a personne de référence. When
+        `check` is true, the structure of the test case is checked in one pass, see check_trusted_test_case; otherwise
+        it isn't checked at all. Neither the age of the personnes à charge nor the values are checked, and the test
+        case isn't copied.
+        """
+        if check:
+            check_trusted_test_case(self.tax_benefit_system, test_case)
+        self.axes = None
+        self.input_variables = None
+        self.period = periods.period(period)
+        self.test_case = dict(
+            (entity.plural, test_case.get(entity.plural) or [])
+            for entity in self.tax_benefit_system.entities
+            )
+        return self
+
     def post_process_test_case(self, test_case, period, state):
 
         individu_by_id = {
@@ -245,13 +267,25 @@ class Scenario(scenarios.AbstractScenario):
         return test_case, error
 
     def attribute_groupless_persons_to_entities(self, test_case, period, groupless_individus):
-        individus_without_menage = groupless_individus['menages']
-        individus_without_foyer_fiscal = groupless_individus['foyers_fiscaux']
-
         individu_by_id = {
             individu['id']: individu
             for individu in test_case['individus']
             }
+        # Entité et rôle de chaque individu, indexés une fois par cas type et tenus à jour à chaque affectation, pour
+        # que l'affectation des individus soit linéaire.
+        foyer_fiscal_and_role_by_id = build_foyer_fiscal_and_role_by_id(test_case)
+        menage_and_role_by_id = build_menage_and_role_by_id(test_case)
+
+        def add_to_foyer_fiscal(foyer_fiscal, role, individu_id):
+            foyer_fiscal[role].append(individu_id)
+            foyer_fiscal_and_role_by_id[individu_id] = foyer_fiscal, role
+
+        def add_to_menage(menage, role, individu_id):
+            if role in (u'personne_de_reference', u'conjoint'):
+                menage[role] = individu_id
+            else:
+                menage[role].append(individu_id)
+            menage_and_role_by_id[individu_id] = menage, role
 
         # Affecte à un foyer fiscal chaque individu qui n'appartient à aucun d'entre eux.
         new_foyer_fiscal = dict(
@@ -259,215 +293,110 @@ class Scenario(scenarios.AbstractScenario):
             personnes_a_charge = [],
             )
         new_foyer_fiscal_id = None
-        for individu_id in individus_without_foyer_fiscal[:]:
+        for individu_id in groupless_individus['foyers_fiscaux']:
             # Tente d'affecter l'individu à un foyer fiscal d'après son ménage.
-            menage, menage_role = find_menage_and_role(test_case, individu_id)
+            menage, menage_role = menage_and_role_by_id.get(individu_id, (None, None))
             if menage_role == u'personne_de_reference':
-                conjoint_id = menage[u'conjoint']
+                conjoint_id = menage.get(u'conjoint')
                 if conjoint_id is not None:
-                    foyer_fiscal, other_role = find_foyer_fiscal_and_role(test_case, conjoint_id)
+                    foyer_fiscal, other_role = foyer_fiscal_and_role_by_id.get(conjoint_id, (None, None))
                     if other_role == u'declarants' and len(foyer_fiscal[u'declarants']) == 1:
                         # Quand l'individu n'est pas encore dans un foyer fiscal, mais qu'il est personne de
                         # référence dans un ménage, qu'il y a un conjoint dans ce ménage et que ce
                         # conjoint est seul déclarant dans un foyer fiscal, alors ajoute l'individu comme
                         # autre déclarant de ce foyer fiscal.
-                        foyer_fiscal[u'declarants'].append(individu_id)
-                        individus_without_foyer_fiscal.remove(individu_id)
+                        add_to_foyer_fiscal(foyer_fiscal, u'declarants', individu_id)
             elif menage_role == u'conjoint':
-                personne_de_reference_id = menage[u'personne_de_reference']
+                personne_de_reference_id = menage.get(u'personne_de_reference')
                 if personne_de_reference_id is not None:
-                    foyer_fiscal, other_role = find_foyer_fiscal_and_role(test_case, personne_de_reference_id)
+                    foyer_fiscal, other_role = foyer_fiscal_and_role_by_id.get(personne_de_reference_id,
+                        (None, None))
                     if other_role == u'declarants' and len(foyer_fiscal[u'declarants']) == 1:
                         # Quand l'individu n'est pas encore dans un foyer fiscal, mais qu'il est conjoint
                         # dans un ménage, qu'il y a une personne de référence dans ce ménage et que
                         # cette personne est seul déclarant dans un foyer fiscal, alors ajoute l'individu
                         # comme autre déclarant de ce foyer fiscal.
-                        foyer_fiscal[u'declarants'].append(individu_id)
-                        individus_without_foyer_fiscal.remove(individu_id)
-            elif menage_role == u'enfants' and (
-                    menage['personne_de_reference'] is not None or menage[u'conjoint'] is not None):
-                for other_id in (menage['personne_de_reference'], menage[u'conjoint']):
+                        add_to_foyer_fiscal(foyer_fiscal, u'declarants', individu_id)
+            elif menage_role == u'enfants':
+                for other_id in (menage.get(u'personne_de_reference'), menage.get(u'conjoint')):
                     if other_id is None:
                         continue
-                    foyer_fiscal, other_role = find_foyer_fiscal_and_role(test_case, other_id)
+                    foyer_fiscal, other_role = foyer_fiscal_and_role_by_id.get(other_id, (None, None))
                     if other_role == u'declarants':
                         # Quand l'individu n'est pas encore dans un foyer fiscal, mais qu'il est enfant dans
-                        # un ménage, qu'il y a une personne à charge ou un conjoint dans ce ménage et que
+                        # un ménage, qu'il y a une personne de référence ou un conjoint dans ce ménage et que
                         # celui-ci est déclarant dans un foyer fiscal, alors ajoute l'individu comme
                         # personne à charge de ce foyer fiscal.
-                        foyer_fiscal[u'personnes_a_charge'].append(individu_id)
-                        individus_without_foyer_fiscal.remove(individu_id)
+                        add_to_foyer_fiscal(foyer_fiscal, u'personnes_a_charge', individu_id)
                         break
 
-            if individu_id in individus_without_foyer_fiscal:
+            if individu_id not in foyer_fiscal_and_role_by_id:
                 # L'individu n'est toujours pas affecté à un foyer fiscal.
                 individu = individu_by_id[individu_id]
                 age = find_age(individu, period.start.date)
                 if len(new_foyer_fiscal[u'declarants']) < 2 and (age is None or age >= 18):
-                    new_foyer_fiscal[u'declarants'].append(individu_id)
+                    add_to_foyer_fiscal(new_foyer_fiscal, u'declarants', individu_id)
                 else:
-                    new_foyer_fiscal[u'personnes_a_charge'].append(individu_id)
+                    add_to_foyer_fiscal(new_foyer_fiscal, u'personnes_a_charge', individu_id)
                 if new_foyer_fiscal_id is None:
                     new_foyer_fiscal[u'id'] = new_foyer_fiscal_id = unicode(uuid.uuid4())
                     test_case[u'foyers_fiscaux'].append(new_foyer_fiscal)
-                individus_without_foyer_fiscal.remove(individu_id)
-
-            # Affecte à un ménage chaque individu qui n'appartient à aucun d'entre eux.
-            new_menage = dict(
-                autres = [],
-                conjoint = None,
-                enfants = [],
-                personne_de_reference = None,
-                )
-            new_menage_id = None
-            for individu_id in menages_individus_id[:]:
-                # Tente d'affecter l'individu à un ménage d'après son foyer fiscal.
-                foyer_fiscal, foyer_fiscal_role = find_foyer_fiscal_and_role(test_case, individu_id)
-                if foyer_fiscal_role == u'declarants' and len(foyer_fiscal[u'declarants']) == 2:
-                    for declarant_id in foyer_fiscal[u'declarants']:
-                        if declarant_id != individu_id:
-                            menage, other_role = find_menage_and_role(test_case, declarant_id)
-                            if other_role == u'personne_de_reference' and menage[u'conjoint'] is None:
-                                # Quand l'individu n'est pas encore dans un ménage, mais qu'il est déclarant
-                                # dans un foyer fiscal, qu'il y a un autre déclarant dans ce foyer fiscal et que
-                                # cet autre déclarant est personne de référence dans un ménage et qu'il n'y a
-                                # pas de conjoint dans ce ménage, alors ajoute l'individu comme conjoint de ce
-                                # ménage.
-                                menage[u'conjoint'] = individu_id
-                                menages_individus_id.remove(individu_id)
-                            elif other_role == u'conjoint' and menage[u'personne_de_reference'] is None:
-                                # Quand l'individu n'est pas encore dans un ménage, mais qu'il est déclarant
-                                # dans une foyer fiscal, qu'il y a un autre déclarant dans ce foyer fiscal et
-                                # que cet autre déclarant est conjoint dans un ménage et qu'il n'y a pas de
-                                # personne de référence dans ce ménage, alors ajoute l'individu comme personne
-                                # de référence de ce ménage.
-                                menage[u'personne_de_reference'] = individu_id
-                                menages_individus_id.remove(individu_id)
-                            break
-                elif foyer_fiscal_role == u'personnes_a_charge' and foyer_fiscal[u'declarants']:
-                    for declarant_id in foyer_fiscal[u'declarants']:
-                        menage, other_role = find_menage_and_role(test_case, declarant_id)
-                        if other_role in (u'personne_de_reference', u'conjoint'):
-                            # Quand l'individu n'est pas encore dans un ménage, mais qu'il est personne à charge
-                            # dans un foyer fiscal, qu'il y a un déclarant dans ce foyer fiscal et que ce
-                            # déclarant est personne de référence ou conjoint dans un ménage, alors ajoute
-                            # l'individu comme enfant de ce ménage.
-                            menage[u'enfants'].append(individu_id)
-                            menages_individus_id.remove(individu_id)
-                            break
-
-                if individu_id in menages_individus_id:
-                    # L'individu n'est toujours pas affecté à un ménage.
-                    if new_menage[u'personne_de_reference'] is None:
-                        new_menage[u'personne_de_reference'] = individu_id
-                    elif new_menage[u'conjoint'] is None:
-                        new_menage[u'conjoint'] = individu_id
-                    else:
-                        new_menage[u'enfants'].append(individu_id)
-                    if new_menage_id is None:
-                        new_menage[u'id'] = new_menage_id = unicode(uuid.uuid4())
-                        test_case[u'menages'].append(new_menage)
-                    menages_individus_id.remove(individu_id)
-
-        remaining_individus_id = set(individus_without_foyer_fiscal).union(menages_individus_id)
-        if remaining_individus_id:
-            individu_index_by_id = {
-                individu[u'id']: individu_index
-                for individu_index, individu in enumerate(test_case[u'individus'])
-                }
-            if error is None:
-                error = {}
-            for individu_id in remaining_individus_id:
-                error.setdefault('individus', {})[individu_index_by_id[individu_id]] = state._(
-                    u"Individual is missing from {}").format(
-                        state._(u' & ').join(
-                            word
-                            for word in [
-                                u'foyers_fiscaux' if individu_id in individus_without_foyer_fiscal else None,
-                                u'menages' if individu_id in menages_individus_id else None,
-                                ]
-                            if word is not None
-                            ))
-        if error is not None:
-            return test_case, error
-
-            # Third validation step
-            individu_by_id = test_case['individus']
-            test_case, error = conv.struct(
-                dict(
-                    foyers_fiscaux = conv.pipe(
-                        conv.uniform_sequence(
-                            conv.struct(
-                                dict(
-                                    declarants = conv.pipe(
-                                        conv.empty_to_none,
-                                        conv.not_none,
-                                        conv.test(
-                                            lambda declarants: len(declarants) <= 2,
-                                            error = N_(u'A "foyer_fiscal" must have at most 2 "declarants"'),
-                                            ),
-                                        # conv.uniform_sequence(conv.pipe(
-                                            # conv.test(lambda individu_id:
-                                            #     find_age(individu_by_id[individu_id], period.start.date,
-                                            #         default = 100) >= 18,
-                                            #     error = u"Un déclarant d'un foyer fiscal doit être agé d'au moins 18"
-                                            #         u" ans",
-                                            #     ),
-                                            # conv.test(
-                                                # lambda individu_id: individu_id in parents_id,
-                                                # error = u"Un déclarant ou un conjoint sur la déclaration d'impôt, doit"
-                                                        # u" être un parent dans sa famille",
-                                                # ),
-                                            # )),
-                                        ),
-                                    personnes_a_charge = conv.uniform_sequence(
-                                        conv.test(
-                                            lambda individu_id:
-                                                individu_by_id[individu_id].get('invalide', False)
-                                                or find_age(individu_by_id[individu_id], period.start.date,
-                                                    default = 0) < 25,
-                                            error = u"Une personne à charge d'un foyer fiscal doit avoir moins de"
-                                                    u" 25 ans ou être invalide",
-                                            ),
-                                        ),
-                                    ),
-                                default = conv.noop,
-                                ),
-                            ),
-                        conv.empty_to_none,
-                        conv.not_none,
-                        ),
-                    # individus = conv.uniform_sequence(
-                    #     conv.struct(
-                    #         dict(
-                    #             date_naissance = conv.test(
-                    #                 lambda date_naissance: period.start.date - date_naissance >= datetime.timedelta(0),
-                    #                 error = u"L'individu doit être né au plus tard le jour de la simulation",
-                    #                 ),
-                    #             ),
-                    #         default = conv.noop,
-                    #         drop_none_values = 'missing',
-                    #         ),
-                    #     ),
-                    menages = conv.pipe(
-                        conv.uniform_sequence(
-                            conv.struct(
-                                dict(
-                                    personne_de_reference = conv.not_none,
-                                    ),
-                                default = conv.noop,
-                                ),
-                            ),
-                        conv.empty_to_none,
-                        conv.not_none,
-                        ),
-                    ),
-                default = conv.noop,
-                )(test_case, state = state)
 
-            return test_case, error
+        # Affecte à un ménage chaque individu qui n'appartient à aucun d'entre eux.
+        new_menage = dict(
+            autres = [],
+            conjoint = None,
+            enfants = [],
+            personne_de_reference = None,
+            )
+        new_menage_id = None
+        for individu_id in groupless_individus['menages']:
+            # Tente d'affecter l'individu à un ménage d'après son foyer fiscal.
+            foyer_fiscal, foyer_fiscal_role = foyer_fiscal_and_role_by_id.get(individu_id, (None, None))
+            if foyer_fiscal_role == u'declarants' and len(foyer_fiscal[u'declarants']) == 2:
+                for declarant_id in foyer_fiscal[u'declarants']:
+                    if declarant_id != individu_id:
+                        menage, other_role = menage_and_role_by_id.get(declarant_id, (None, None))
+                        if other_role == u'personne_de_reference' and menage.get(u'conjoint') is None:
+                            # Quand l'individu n'est pas encore dans un ménage, mais qu'il est déclarant
+                            # dans un foyer fiscal, qu'il y a un autre déclarant dans ce foyer fiscal et que
+                            # cet autre déclarant est personne de référence dans un ménage et qu'il n'y a
+                            # pas de conjoint dans ce ménage, alors ajoute l'individu comme conjoint de ce
+                            # ménage.
+                            add_to_menage(menage, u'conjoint', individu_id)
+                        elif other_role == u'conjoint' and menage.get(u'personne_de_reference') is None:
+                            # Quand l'individu n'est pas encore dans un ménage, mais qu'il est déclarant
+                            # dans une foyer fiscal, qu'il y a un autre déclarant dans ce foyer fiscal et
+                            # que cet autre déclarant est conjoint dans un ménage et qu'il n'y a pas de
+                            # personne de référence dans ce ménage, alors ajoute l'individu comme personne
+                            # de référence de ce ménage.
+                            add_to_menage(menage, u'personne_de_reference', individu_id)
+                        break
+            elif foyer_fiscal_role == u'personnes_a_charge' and foyer_fiscal[u'declarants']:
+                for declarant_id in foyer_fiscal[u'declarants']:
+                    menage, other_role = menage_and_role_by_id.get(declarant_id, (None, None))
+                    if other_role in (u'personne_de_reference', u'conjoint'):
+                        # Quand l'individu n'est pas encore dans un ménage, mais qu'il est personne à charge
+                        # dans un foyer fiscal, qu'il y a un déclarant dans ce foyer fiscal et que ce
+                        # déclarant est personne de référence ou conjoint dans un ménage, alors ajoute
+                        # l'individu comme enfant de ce ménage.
+                        add_to_menage(menage, u'enfants', individu_id)
+                        break
+
+            if individu_id not in menage_and_role_by_id:
+                # L'individu n'est toujours pas affecté à un ménage.
+                if new_menage[u'personne_de_reference'] is None:
+                    add_to_menage(new_menage, u'personne_de_reference', individu_id)
+                elif new_menage[u'conjoint'] is None:
+                    add_to_menage(new_menage, u'conjoint', individu_id)
+                else:
+                    add_to_menage(new_menage, u'enfants', individu_id)
+                if new_menage_id is None:
+                    new_menage[u'id'] = new_menage_id = unicode(uuid.uuid4())
+                    test_case[u'menages'].append(new_menage)
 
-        return json_or_python_to_test_case
+        # Les individus restant sans entité sont signalés par la validation qui suit.
+        return test_case
 
     def suggest(self):
         """Returns a dict of suggestions and modifies self.test_case applying those suggestions."""
@@ -573,6 +502,96 @@ class Scenario(scenarios.AbstractScenario):
         return self_json
 
 
+# Trusted test cases
+
+
+test_case_schema_by_tax_benefit_system = weakref.WeakKeyDictionary()
+
+
+def get_test_case_schema(tax_benefit_system):
+    """
+    Return, by entity plural, the entity, the maximum count of each role by name, the name of the role which must have
+    a member and the names of its variables.
+    """
+    schema = test_case_schema_by_tax_benefit_system.get(tax_benefit_system)
+    if schema is None:
+        schema = test_case_schema_by_tax_benefit_system[tax_benefit_system] = {}
+        for entity in tax_benefit_system.entities:
+            max_by_role_name = {}
+            required_role_name = None
+            if not entity.is_person:
+                for role in entity.roles:
+                    if role.max == 1:
+                        role_name = role.key
+                        max_by_role_name[role_name] = 1
+                    else:
+                        role_name = role.plural
+                        max_by_role_name[role_name] = len(role.subroles) if role.subroles else None
+                    # Like in post_process_test_case, the first role, declarants or personne de référence, is required.
+                    if required_role_name is None:
+                        required_role_name = role_name
+            variables_name = set(
+                name
+                for name, column in tax_benefit_system.column_by_name.iteritems()
+                if column.entity == entity
+                )
+            schema[entity.plural] = entity, max_by_role_name, required_role_name, variables_name
+    return schema
+
+
+def check_trusted_test_case(tax_benefit_system, test_case):
+    """Check the structure of a test case in one pass, raising ValueError when it is invalid.
+
+    Each entity must have a unique id and known roles and variables, values by period must be keyed by
+    periods.Period objects, and each individual must belong to exactly one entity of each group entity. The first
+    role of each group entity, declarants or personne de référence, must have a member.
+    """
+    schema = get_test_case_schema(tax_benefit_system)
+    for plural in test_case:
+        if plural not in schema:
+            raise ValueError(u"Invalid entity name: {}".format(plural).encode('utf-8'))
+    persons_plural = tax_benefit_system.person_entity.plural
+    persons_id = set()
+    for plural, (entity, max_by_role_name, required_role_name, variables_name) in schema.iteritems():
+        entities_id = set()
+        for entity_json in test_case.get(plural) or []:
+            entity_id = entity_json.get('id')
+            if entity_id is None or entity_id in entities_id:
+                raise ValueError(u"Missing or duplicate id in {}: {}".format(plural, entity_json).encode('utf-8'))
+            entities_id.add(entity_id)
+            for key, value in entity_json.iteritems():
+                if key in variables_name:
+                    if isinstance(value, dict) and not all(isinstance(period, periods.Period) for period in value):
+                        raise ValueError(u"Values of {} must be keyed by periods.Period objects in {}: {}".format(
+                            key, plural, entity_json).encode('utf-8'))
+                elif key != 'id' and key not in max_by_role_name:
+                    raise ValueError(u"Invalid key {} in {}: {}".format(key, plural, entity_json).encode('utf-8'))
+        if plural == persons_plural:
+            persons_id = entities_id
+    for plural, (entity, max_by_role_name, required_role_name, variables_name) in schema.iteritems():
+        if entity.is_person:
+            continue
+        members_id = set()
+        members_count = 0
+        for entity_json in test_case.get(plural) or []:
+            if entity_json.get(required_role_name) in (None, []):
+                raise ValueError(u"Missing {} in {}: {}".format(required_role_name, plural, entity_json).encode(
+                    'utf-8'))
+            for role_name, max_count in max_by_role_name.iteritems():
+                members = entity_json.get(role_name)
+                if members is None:
+                    continue
+                if max_count == 1:
+                    members = [members]
+                elif max_count is not None and len(members) > max_count:
+                    raise ValueError(u"Too many {} in {}: {}".format(role_name, plural, entity_json).encode('utf-8'))
+                members_id.update(members)
+                members_count += len(members)
+        if members_id != persons_id or members_count != len(persons_id):
+            raise ValueError(u"Each of the {} must belong to exactly one of the {}".format(
+                persons_plural, plural).encode('utf-8'))
+
+
 # Finders
 
 
@@ -626,3 +645,28 @@ def find_menage_and_role(test_case, individu_id):
             if individu_id in menage[role]:
                 return menage, role
     return None, None
+
+
+def build_foyer_fiscal_and_role_by_id(test_case):
+    # Les entités sont parcourues à rebours pour que, comme dans find_foyer_fiscal_and_role, le premier rôle trouvé
+    # l'emporte.
+    foyer_fiscal_and_role_by_id = {}
+    for foyer_fiscal in reversed(test_case['foyers_fiscaux']):
+        for role in (u'personnes_a_charge', u'declarants'):
+            for individu_id in foyer_fiscal.get(role, []):
+                foyer_fiscal_and_role_by_id[individu_id] = foyer_fiscal, role
+    return foyer_fiscal_and_role_by_id
+
+
+def build_menage_and_role_by_id(test_case):
+    # Même ordre que find_menage_and_role
+    menage_and_role_by_id = {}
+    for menage in reversed(test_case['menages']):
+        for role in (u'autres', u'enfants'):
+            for individu_id in menage.get(role, []):
+                menage_and_role_by_id[individu_id] = menage, role
+        for role in (u'conjoint', u'personne_de_reference'):
+            individu_id = menage.get(role)
+            if individu_id is not None:
+                menage_and_role_by_id[individu_id] = menage, role
+    return menage_and_role_by_id
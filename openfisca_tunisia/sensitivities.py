@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+
+"""Compute the exact derivatives of variables with respect to an input, for every individual, in one simulation.
+
+Formulas from the salary to the income tax are piecewise linear: their derivatives are propagated forward from the
+input, variable by variable, by the tangent rules of this module, which read the brackets of the tax scales at the
+values computed by the simulation. Derivatives are right derivatives: at a threshold, the rate of the upper bracket
+applies. Discontinuities, like the loss of the SMIG deduction, are not taken into account.
+"""
+
+
+from __future__ import division
+
+import collections
+
+import numpy as np
+
+from openfisca_core import periods
+
+from .entities import FoyerFiscal
+from .model.baremes import calculer_taux_marginal
+from .model.prelevements_obligatoires.cotisations_sociales import (COTISATIONS, get_baremes_cotisations,
+    partition_by_regime)
+from .reform_deltas import iter_arrays
+from .sub_simulations import get_dependency_cone
+
+
+tangent_rule_by_variable_name = {}
+
+
+def tangent_rule(*variables_name):
+    """Register the decorated function as the tangent rule of the formulas of `variables_name`."""
+    def register(function):
+        for variable_name in variables_name:
+            tangent_rule_by_variable_name[variable_name] = function
+        return function
+    return register
+
+
+def iter_months(period):
+    first_month = period.first_month
+    return [first_month.offset(index, periods.MONTH) for index in range(period.size_in_months)]
+
+
+# Tangent rules: `tangent(variable_name, period)` returns the derivative of a variable, `variable_name` is the name
+# of the variable whose derivative is returned.
+
+
+@tangent_rule('assiette_cotisations_sociales')
+def tangent_assiette_cotisations_sociales(simulation, period, tangent, variable_name):
+    return tangent('salaire_de_base', period) + tangent('primes', period)
+
+
+@tangent_rule(*[name for name, cotisation_type, bareme_name in COTISATIONS])
+def tangent_cotisation(simulation, period, tangent, variable_name):
+    individus = simulation.persons
+    assiette_cotisations_sociales = simulation.calculate('assiette_cotisations_sociales', period)
+    tangent_assiette = tangent('assiette_cotisations_sociales', period)
+    baremes_cotisations = get_baremes_cotisations(individus, period, simulation.legislation_at)
+    cotisation_index = [name for name, cotisation_type, bareme_name in COTISATIONS].index(variable_name)
+    result = np.zeros(individus.count)
+    for regime_name, regime_index, members in partition_by_regime(simulation.calculate('categorie_salarie', period)):
+        for index, bareme in baremes_cotisations[regime_index]:
+            if index == cotisation_index:
+                result[members] = - calculer_taux_marginal(bareme, assiette_cotisations_sociales[members]) * \
+                    tangent_assiette[members]
+    return result
+
+
+@tangent_rule('cotisations_employeur', 'cotisations_salarie')
+def tangent_cotisations(simulation, period, tangent, variable_name):
+    cotisation_type = variable_name.split('_')[-1]
+    return sum(
+        tangent(name, period)
+        for name, type_, bareme_name in COTISATIONS
+        if type_ == cotisation_type
+        )
+
+
+@tangent_rule('salaire_super_brut')
+def tangent_salaire_super_brut(simulation, period, tangent, variable_name):
+    return tangent('salaire_de_base', period) + tangent('primes', period) - tangent('cotisations_employeur', period)
+
+
+@tangent_rule('salaire_imposable')
+def tangent_salaire_imposable(simulation, period, tangent, variable_name):
+    return tangent('assiette_cotisations_sociales', period) + tangent('cotisations_salarie', period)
+
+
+@tangent_rule('salaire_imposable_annuel')
+def tangent_salaire_imposable_annuel(simulation, period, tangent, variable_name):
+    return sum(tangent('salaire_imposable', month) for month in iter_months(period))
+
+
+@tangent_rule('revenu_assimile_salaire')
+def tangent_revenu_assimile_salaire(simulation, period, tangent, variable_name):
+    return simulation.foyer_fiscal.value_from_person(
+        tangent('salaire_imposable_annuel', period) +
+        sum(tangent('salaire_en_nature', month) for month in iter_months(period)),
+        FoyerFiscal.DECLARANT_PRINCIPAL,
+        )
+
+
+@tangent_rule('revenu_assimile_salaire_apres_abattements')
+def tangent_revenu_assimile_salaire_apres_abattements(simulation, period, tangent, variable_name):
+    # The SMIG deduction only changes at a threshold of the income.
+    abat_sal = simulation.legislation_at(period.start).impot_revenu.tspr.abat_sal
+    positive = simulation.calculate('revenu_assimile_salaire_apres_abattements', period) > 0
+    return positive * (1 - abat_sal) * tangent('revenu_assimile_salaire', period)
+
+
+@tangent_rule('revenu_assimile_pension_apres_abattements')
+def tangent_revenu_assimile_pension_apres_abattements(simulation, period, tangent, variable_name):
+    abat_pen = simulation.legislation_at(period.start).impot_revenu.tspr.abat_pen
+    return (1 - abat_pen) * simulation.foyer_fiscal.value_from_person(
+        tangent('revenu_assimile_pension', period) + tangent('avantages_nature_assimile_pension', period),
+        FoyerFiscal.DECLARANT_PRINCIPAL,
+        )
+
+
+@tangent_rule('tspr')
+def tangent_tspr(simulation, period, tangent, variable_name):
+    return (
+        tangent('revenu_assimile_salaire_apres_abattements', period) +
+        tangent('revenu_assimile_pension_apres_abattements', period)
+        )
+
+
+@tangent_rule('rng')
+def tangent_rng(simulation, period, tangent, variable_name):
+    return (
+        tangent('tspr', period) + tangent('revenus_fonciers', period) + tangent('rvcm', period) +
+        tangent('retr', period)
+        )
+
+
+@tangent_rule('rni')
+def tangent_rni(simulation, period, tangent, variable_name):
+    return tangent('rng', period) - (
+        tangent('deduction_famille', period) +
+        simulation.foyer_fiscal.value_from_person(tangent('rente', period), FoyerFiscal.DECLARANT_PRINCIPAL) +
+        tangent('deduction_assurance_vie', period)
+        )
+
+
+@tangent_rule('ir_brut')
+def tangent_ir_brut(simulation, period, tangent, variable_name):
+    bareme = simulation.legislation_at(period.start).impot_revenu.bareme
+    return - calculer_taux_marginal(bareme, simulation.calculate('rni', period)) * tangent('rni', period)
+
+
+@tangent_rule('irpp')
+def tangent_irpp(simulation, period, tangent, variable_name):
+    return tangent('ir_brut', period)
+
+
+@tangent_rule('salaire_net_a_payer')
+def tangent_salaire_net_a_payer(simulation, period, tangent, variable_name):
+    return (
+        tangent('salaire_imposable', period) +
+        simulation.foyer_fiscal.project(tangent('irpp', period.this_year)) / 12
+        )
+
+
+def contains(period, other_period):
+    return period.start <= other_period.start and other_period.stop <= period.stop
+
+
+def get_seed(column, input_period, period):
+    """
+    Return the change of the input at `input_period` for a change of 1 of the input over `period`, spread evenly
+    among the periods of the input within `period`.
+    """
+    if column.definition_period == periods.ETERNITY:
+        return 1
+    if input_period.size_in_months >= period.size_in_months:
+        return 1 if contains(input_period, period) else 0
+    return input_period.size_in_months / period.size_in_months if contains(period, input_period) else 0
+
+
+def iter_passes(simulation):
+    """
+    Yield the masks of the individuals whose inputs are changed together. Members of a same group entity never are,
+    so that the derivatives of an individual don't include the changes of the other members.
+    """
+    positions = np.array([
+        entity.members_position
+        for entity in simulation.entities.itervalues()
+        if not entity.is_person
+        ])
+    codes = np.ravel_multi_index(positions, positions.max(axis = 1) + 1)
+    for code in np.unique(codes):
+        yield codes == code
+
+
+def calculate_derivatives(scenario, variables_name, input_name, period):
+    """
+    Compute, for every individual, the derivatives of `variables_name` over `period` with respect to its input
+    `input_name` over `period`.
+
+    The input is changed by the same amount in each of its periods within `period`. The derivatives of monthly
+    variables are summed over `period` when it is a year; those of group entity variables are the derivatives of the
+    variables of the entities of each individual. Return, by variable name, the array of the derivatives of each
+    individual.
+    """
+    period = periods.period(period)
+    simulation = scenario.new_simulation()
+    tax_benefit_system = simulation.tax_benefit_system
+    base_tax_benefit_system = tax_benefit_system.base_tax_benefit_system
+    input_column = tax_benefit_system.get_column(input_name, check_existence = True)
+    assert input_column.entity.is_person, "Derivatives are computed with respect to inputs of individuals"
+    input_periods_by_name = collections.defaultdict(set)
+    for entity_key, name, input_period, array in iter_arrays(simulation):
+        input_periods_by_name[name].add(input_period)
+    affected_variables = get_dependency_cone(tax_benefit_system, [input_name])
+
+    derivative_by_name = collections.OrderedDict(
+        (name, np.zeros(simulation.persons.count))
+        for name in variables_name
+        )
+    for seeded in iter_passes(simulation):
+        tangent_by_key = {}
+
+        def tangent(name, tangent_period):
+            column = tax_benefit_system.get_column(name, check_existence = True)
+            if column.definition_period == periods.ETERNITY:
+                tangent_period = None
+            key = (name, tangent_period)
+            result = tangent_by_key.get(key)
+            if result is not None:
+                return result
+            entity = simulation.get_variable_entity(name)
+            if name == input_name:
+                result = seeded * get_seed(column, tangent_period, period)
+            elif name not in affected_variables or tangent_period in input_periods_by_name[name]:
+                result = np.zeros(entity.count)
+            else:
+                rule = tangent_rule_by_variable_name.get(name)
+                if rule is None or column is not base_tax_benefit_system.get_column(name):
+                    raise ValueError("No tangent rule for the formula of {}, which depends on {}".format(
+                        name, input_name))
+                result = rule(simulation, tangent_period, tangent, name)
+            result = tangent_by_key[key] = np.asarray(result, dtype = float) * np.ones(entity.count)
+            return result
+
+        for name in variables_name:
+            column = tax_benefit_system.get_column(name, check_existence = True)
+            if column.definition_period == periods.MONTH and period.unit == periods.YEAR:
+                result = sum(tangent(name, month) for month in iter_months(period))
+            else:
+                result = tangent(name, period)
+            entity = simulation.get_variable_entity(name)
+            if not entity.is_person:
+                result = entity.project(result)
+            derivative_by_name[name][seeded] = result[seeded]
+    return derivative_by_name
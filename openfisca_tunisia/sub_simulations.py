@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+
+import types
+import weakref
+
+from openfisca_core.commons import empty_clone
+
+
+dependants_by_tax_benefit_system = weakref.WeakKeyDictionary()
+
+
+def iter_codes(code):
+    """Yield the code object and the code objects nested in it (lambdas, generator expressions...)."""
+    yield code
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            for nested_code in iter_codes(constant):
+                yield nested_code
+
+
+def get_referenced_names(function, visited_functions):
+    """
+    Return the string constants used by `function` and by the module-level functions it calls.
+
+    Formulas request the variables they depend on by literal names, either directly or through helpers like
+    `compute_cotisation`: these strings are an upper bound of the dependencies of the formula.
+    """
+    names = set()
+    functions = [function]
+    while functions:
+        function = functions.pop()
+        if function in visited_functions:
+            continue
+        visited_functions.add(function)
+        for code in iter_codes(function.func_code):
+            names.update(constant for constant in code.co_consts if isinstance(constant, basestring))
+            for global_name in code.co_names:
+                value = function.func_globals.get(global_name)
+                if isinstance(value, types.FunctionType):
+                    functions.append(value)
+    return names
+
+
+def get_dependants(tax_benefit_system):
+    """Return the names of the variables whose formulas may request each variable, cached by tax-benefit system."""
+    dependants = dependants_by_tax_benefit_system.get(tax_benefit_system)
+    if dependants is not None:
+        return dependants
+
+    column_by_name = tax_benefit_system.column_by_name
+    dependants = dict((name, set()) for name in column_by_name)
+    for name, column in column_by_name.iteritems():
+        formula_class = column.formula_class
+        if formula_class is None:
+            continue
+        referenced_names = set()
+        for dated_formula_class in formula_class.dated_formulas_class:
+            referenced_names.update(get_referenced_names(dated_formula_class['formula_class'].formula.im_func, set()))
+        for referenced_name in referenced_names:
+            if referenced_name in dependants:
+                dependants[referenced_name].add(name)
+
+    dependants_by_tax_benefit_system[tax_benefit_system] = dependants
+    return dependants
+
+
+def get_dependency_cone(tax_benefit_system, variable_names):
+    """Return the names of the given variables and of all the variables which depend on them."""
+    dependants = get_dependants(tax_benefit_system)
+    cone = set()
+    names = list(variable_names)
+    while names:
+        name = names.pop()
+        if name in cone:
+            continue
+        cone.add(name)
+        names.extend(dependants.get(name, ()))
+    return cone
+
+
+def new_sub_simulation(simulation, variable_names):
+    """
+    Return a simulation where the given variables and all their dependants start without any value.
+
+    The holders of the other variables are shared with `simulation`, without copying their arrays: the values they
+    compute are put in the cache of `simulation`. The variables of the cone, inputs included, are recomputed by
+    the sub-simulation once the caller has set the values of `variable_names`.
+    """
+    cone = get_dependency_cone(simulation.tax_benefit_system, variable_names)
+
+    sub_simulation = empty_clone(simulation)
+    sub_simulation_dict = sub_simulation.__dict__
+    for key, value in simulation.__dict__.iteritems():
+        if key not in ('debug', 'debug_all', 'trace', 'stack_trace', 'traceback'):
+            sub_simulation_dict[key] = value
+    # The variables being computed by `simulation` may be computed again by the sub-simulation.
+    sub_simulation.requested_periods_by_variable_name = {}
+
+    sub_simulation.entities = {}
+    for key, entity in simulation.entities.iteritems():
+        sub_entity = empty_clone(entity)
+        sub_entity.__dict__.update(entity.__dict__)
+        sub_entity.simulation = sub_simulation
+        sub_entity._holders = dict(
+            (name, holder)
+            for name, holder in entity._holders.iteritems()
+            if name not in cone
+            )
+        sub_simulation.entities[key] = sub_entity
+        setattr(sub_simulation, key, sub_entity)
+    sub_simulation.persons = sub_simulation.entities[simulation.persons.key]
+    for sub_entity in sub_simulation.entities.itervalues():
+        if not sub_entity.is_person:
+            sub_entity.members = sub_simulation.persons
+
+    return sub_simulation
@@ -1,18 +1,22 @@
 # -*- coding: utf-8 -*-
 
+import copy
+
 from openfisca_core.reforms import Reform, compose_reforms
 from openfisca_core.tools import assert_near
 
 from .. import TunisiaTaxBenefitSystem
 from ..reforms import (
+    de_net_a_brut,
     plf_2017,
-
     )
 
 __all__ = [
     'assert_near',
     'get_cached_composed_reform',
     'get_cached_reform',
+    'irpp_salaire_imposable',
+    'new_household_scenario',
     'tax_benefit_system',
     ]
 
@@ -20,24 +24,42 @@ __all__ = [
 tax_benefit_system = TunisiaTaxBenefitSystem()
 
 
+# Households shared by the tests of the simulation tools, given like in init_single_entity
+household_by_name = dict(
+    # salaire_imposable is an input of a variable which has a formula, in the dependency cone of the contributions
+    # parameters.
+    salaire_imposable = dict(
+        parent1 = dict(male = True, marie = True, salaire_imposable = 17710),
+        ),
+    salaire_de_base = dict(
+        parent1 = dict(male = True, marie = True, salaire_de_base = 30000),
+        parent2 = dict(salaire_de_base = 5000),
+        ),
+    # Income which isn't a salary
+    pension = dict(
+        parent1 = dict(male = True, marie = True, salaire_imposable = 1000, revenu_assimile_pension = 40000),
+        ),
+    )
+# irpp of the salaire_imposable household in 2016: the net taxable income is 15789 DT, in the bracket from 10000 to
+# 20000 DT
+irpp_salaire_imposable = -2972.25
+
+
+def new_household_scenario(name, period = 2016, tax_benefit_system = tax_benefit_system, **parent1):
+    """Return the scenario of the household `name`, the values of its first parent being updated by `parent1`."""
+    household = copy.deepcopy(household_by_name[name])
+    household['parent1'].update(parent1)
+    return tax_benefit_system.new_scenario().init_single_entity(period = period, **household)
+
+
 # Reforms cache, used by long scripts like test_yaml.py
 # The reforms commented haven't been adapted to the new core API yet.
 reform_list = {
+    'de_net_a_brut': de_net_a_brut.de_net_a_brut,
     'plf_2017': plf_2017.plf_2017,
     }
 
 
-# Only use the following reform if scipy can be imported
-try:
-    import scipy
-except ImportError:
-    scipy = None
-
-if scipy is not None:
-    from ..reforms import de_net_a_brut
-    reform_list['de_net_a_brut'] = de_net_a_brut.de_net_a_brut
-
-
 reform_by_full_key = {}
 
 
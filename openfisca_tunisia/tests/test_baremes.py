@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.taxscales import MarginalRateTaxScale
+
+from openfisca_tunisia.model.baremes import calculer_bareme
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+def test_calculer_bareme():
+    legislation = tax_benefit_system.get_compact_legislation(periods.instant(2016))
+    bareme = legislation.impot_revenu.bareme
+    base = np.concatenate((np.linspace(-1000, 80000, 1001), bareme.thresholds))
+    assert_near(calculer_bareme(bareme, base), bareme.calc(base), absolute_error_margin = 1e-6)
+
+
+def test_calculer_bareme_premier_seuil():
+    bareme = MarginalRateTaxScale()
+    bareme.add_bracket(100, .1)
+    bareme.add_bracket(200, .2)
+    assert_near(calculer_bareme(bareme, np.array([-50, 50, 100, 150, 300])), [0, 0, 0, 5, 30],
+        absolute_error_margin = 1e-9)
+
+
+if __name__ == '__main__':
+    test_calculer_bareme()
+    test_calculer_bareme_premier_seuil()
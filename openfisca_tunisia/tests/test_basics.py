@@ -41,6 +41,20 @@ def test_basics():
         yield check_run, simulation, period
 
 
+def test_trace():
+    # En mode trace, les noeuds de la législation sont des TracedCompactNode, qui ne gèrent pas l'opérateur in
+    for year in (2010, 2016):
+        scenario = base.tax_benefit_system.new_scenario().init_single_entity(
+            period = year,
+            parent1 = dict(salaire_imposable = 17710),
+            )
+        base.assert_near(
+            scenario.new_simulation(trace = True).calculate('irpp', year),
+            scenario.new_simulation().calculate('irpp', year),
+            absolute_error_margin = 0.01,
+            )
+
+
 if __name__ == '__main__':
     import logging
     import sys
@@ -48,4 +62,5 @@ if __name__ == '__main__':
     logging.basicConfig(level = logging.ERROR, stream = sys.stdout)
     for _, simulation, period in test_basics():
         check_run(simulation, period)
+    test_trace()
     print u'OpenFisca-Tunisia basic test was executed successfully.'.encode('utf-8')
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from openfisca_tunisia.batches import SingleEntityBatch
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+def test_batch():
+    year = 2016
+    households = [
+        dict(parent1 = dict(salaire_de_base = 30000), parent2 = dict(salaire_de_base = 4000),
+            enfants = [dict(), dict()]),
+        dict(parent1 = dict(salaire_de_base = 12000)),
+        dict(parent1 = dict(salaire_de_base = 0), enfants = [dict()]),
+        dict(parent1 = dict(salaire_de_base = 60000), parent2 = dict()),
+        ]
+    # The clock doesn't move: the batch is full only when it has max_size households.
+    batch = SingleEntityBatch(tax_benefit_system, year, max_size = len(households), clock = lambda: 0)
+    for index, household in enumerate(households):
+        assert not batch.is_full()
+        assert batch.add(**household) == index
+    assert batch.is_full()
+    variables_name = ['irpp', 'revenu_disponible', 'salaire_net_a_payer']
+    results = batch.calculate(variables_name)
+    assert not batch.households
+    for household, array_by_name in zip(households, results):
+        simulation = tax_benefit_system.new_scenario().init_single_entity(period = year,
+            **household).new_simulation()
+        for name in variables_name:
+            assert_near(array_by_name[name], simulation.calculate_add(name, year), absolute_error_margin = 1e-2)
+
+
+def test_batch_delay():
+    now = [100]
+    batch = SingleEntityBatch(tax_benefit_system, 2016, max_delay = 5, clock = lambda: now[0])
+    assert not batch.is_full()
+    batch.add(parent1 = dict(salaire_de_base = 12000))
+    now[0] += 4
+    batch.add(parent1 = dict(salaire_de_base = 24000))
+    assert not batch.is_full()
+    now[0] += 1
+    assert batch.is_full()
+    assert len(batch.calculate(['irpp'])) == 2
+    assert not batch.is_full()
+
+
+if __name__ == '__main__':
+    test_batch()
+    test_batch_delay()
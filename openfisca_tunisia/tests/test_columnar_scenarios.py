@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from nose.tools import raises
+
+from openfisca_tunisia.columnar_scenarios import new_columnar_scenario, SingleEntityTemplate
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+def test_columnar_scenario():
+    year = 2016
+    # A couple with two children and a single parent with a child, whose individuals are interleaved
+    menage = np.array([0, 1, 0, 1, 0, 0])
+    role = np.array([0, 0, 1, 2, 2, 2])
+    salaire_de_base = np.array([30000, 12000, 4000, 0, 0, 0])
+    scenario = new_columnar_scenario(
+        tax_benefit_system,
+        year,
+        dict(salaire_de_base = salaire_de_base),
+        dict(
+            foyer_fiscal = (menage, np.minimum(role, 1)),
+            menage = (menage, role),
+            ),
+        )
+    simulation = scenario.new_simulation()
+    assert (simulation.menage.members_position == [0, 0, 1, 1, 2, 3]).all()
+    households = [
+        dict(parent1 = dict(salaire_de_base = 30000), parent2 = dict(salaire_de_base = 4000),
+            enfants = [dict(), dict()]),
+        dict(parent1 = dict(salaire_de_base = 12000), enfants = [dict()]),
+        ]
+    for index, household in enumerate(households):
+        household_simulation = tax_benefit_system.new_scenario().init_single_entity(period = year,
+            **household).new_simulation()
+        for name in ('irpp', 'revenu_disponible'):
+            assert_near(simulation.calculate(name, year)[index], household_simulation.calculate(name, year),
+                absolute_error_margin = 1e-2)
+
+
+def test_single_entity_template():
+    year = 2016
+    template = SingleEntityTemplate(tax_benefit_system, parent2 = True, enfants_count = 2)
+    for salaire_de_base in (0, 12000, 30000):
+        household = dict(
+            parent1 = dict(salaire_de_base = salaire_de_base, categorie_salarie = 0),
+            parent2 = dict(salaire_de_base = {'2016-01': 1000, '2016-02': 1000}),
+            enfants = [dict(), dict(age = 10)],
+            )
+        simulation = template.new_scenario(year, **household).new_simulation()
+        reference_simulation = tax_benefit_system.new_scenario().init_single_entity(period = year,
+            **household).new_simulation()
+        for name in ('irpp', 'revenu_disponible'):
+            assert_near(simulation.calculate(name, year), reference_simulation.calculate(name, year),
+                absolute_error_margin = 1e-2)
+
+
+@raises(ValueError)
+def test_single_entity_template_shape():
+    SingleEntityTemplate(tax_benefit_system, enfants_count = 1).new_scenario(2016, parent1 = {})
+
+
+if __name__ == '__main__':
+    test_columnar_scenario()
+    test_single_entity_template()
+    test_single_entity_template_shape()
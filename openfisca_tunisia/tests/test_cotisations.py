@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+from openfisca_core import periods
+
+from openfisca_tunisia.model.prelevements_obligatoires.cotisations_sociales import CAT, COTISATIONS
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+def test_cotisations_agregees():
+    month = periods.period('2016-03')
+    input_variables = dict(
+        salaire_de_base = {month: [500 * (index + 1) for index in range(2 * len(CAT))]},
+        categorie_salarie = [index % len(CAT) for index in range(2 * len(CAT))],
+        )
+    simulation = tax_benefit_system.new_scenario().init_from_attributes(
+        period = 2016,
+        input_variables = input_variables,
+        ).new_simulation()
+    total_by_type = dict(
+        (cotisation_type, simulation.calculate('cotisations_{}'.format(cotisation_type), month))
+        for cotisation_type in ['employeur', 'salarie']
+        )
+    # Les totaux sont calculés sans calculer les cotisations une à une
+    assert all(
+        simulation.persons.get_holder(variable_name).get_array(month) is None
+        for variable_name, _, _ in COTISATIONS
+        )
+    for cotisation_type, total in total_by_type.iteritems():
+        somme = sum(
+            simulation.calculate(variable_name, month)
+            for variable_name, type_, _ in COTISATIONS
+            if type_ == cotisation_type
+            )
+        if cotisation_type == 'salarie':
+            somme += simulation.calculate('ugtt', month)
+        assert_near(total, somme, absolute_error_margin = 0.001)
+
+
+def test_cotisations_agregees_saisies():
+    # Une cotisation saisie remplace son calcul dans le total, qui n'utilise donc pas le barème agrégé
+    month = periods.period('2016-03')
+    simulation = tax_benefit_system.new_scenario().init_single_entity(
+        period = month,
+        parent1 = dict(salaire_de_base = 1000, retraite_salarie = -500),
+        ).new_simulation()
+    cotisations_salarie = simulation.calculate('cotisations_salarie', month)
+    assert_near(
+        cotisations_salarie,
+        sum(
+            simulation.calculate(variable_name, month)
+            for variable_name, type_, _ in COTISATIONS
+            if type_ == 'salarie'
+            ) + simulation.calculate('ugtt', month),
+        absolute_error_margin = 0.001,
+        )
+    assert_near(cotisations_salarie, -544.44, absolute_error_margin = 0.01)
+    assert_near(simulation.calculate('salaire_imposable', month), 455.56, absolute_error_margin = 0.01)
+
+
+if __name__ == '__main__':
+    test_cotisations_agregees()
+    test_cotisations_agregees_saisies()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+import numpy as np
+
+from openfisca_tunisia.curves import calculate_breakpoints, calculate_curve
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+def new_scenario(**parent1):
+    parent1.update(male = True, marie = True)
+    return tax_benefit_system.new_scenario().init_single_entity(
+        period = 2016,
+        parent1 = parent1,
+        enfants = [dict(), dict()],
+        )
+
+
+def test_curve():
+    year = 2016
+    values = [0, 5000, 17710, 30000, 100000]
+    for axis_name in ['salaire_de_base', 'salaire_imposable']:
+        array_by_name = calculate_curve(new_scenario(), axis_name, values, ['irpp', 'salaire_net_a_payer'], year)
+        assert array_by_name['irpp'].shape == (len(values), 1)
+        assert array_by_name['salaire_net_a_payer'].shape == (len(values), 3)
+        for index, value in enumerate(values):
+            simulation = new_scenario(**{axis_name: value}).new_simulation()
+            assert_near(array_by_name['irpp'][index], simulation.calculate('irpp', year), absolute_error_margin = 1e-3)
+            assert_near(array_by_name['salaire_net_a_payer'][index],
+                simulation.calculate_add('salaire_net_a_payer', year), absolute_error_margin = 1e-3)
+
+
+def test_breakpoints():
+    year = 2016
+    variables_name = ['irpp', 'salaire_net_a_payer']
+    points, array_by_name = calculate_breakpoints(new_scenario(), 'salaire_imposable', (0, 100000), variables_name,
+        year)
+    # Brackets of the income tax, and loss of the SMIG deduction
+    assert len(points) < 20
+    values = np.linspace(0, 100000, 1001)
+    dense_array_by_name = calculate_curve(new_scenario(), 'salaire_imposable', values, variables_name, year)
+    for name in variables_name:
+        for column in range(array_by_name[name].shape[1]):
+            assert_near(np.interp(values, points, array_by_name[name][:, column]),
+                dense_array_by_name[name][:, column], absolute_error_margin = 0.05)
+
+
+if __name__ == '__main__':
+    test_curve()
+    test_breakpoints()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+from numpy import array, minimum as min_
+
+from openfisca_core.reforms import Reform, compose_reforms
+
+from openfisca_tunisia.model.base import *
+from openfisca_tunisia.reforms import de_net_a_brut
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+class irpp(Variable):
+    column = FloatCol
+    entity = FoyerFiscal
+    label = u"Impôt sur le revenu des personnes physiques"
+    definition_period = YEAR
+
+    def formula(foyer_fiscal, period):
+        return foyer_fiscal('ir_brut', period = period)
+
+
+class irpp_remplace(Reform):
+    name = u"Remplace la formule de l'IRPP"
+
+    def apply(self):
+        self.update_variable(irpp)
+
+
+def test_resoudre():
+    cible = array([-10, 0, 5, 40, 1000])
+    solution = de_net_a_brut.resoudre(
+        lambda x: min_(x, 10) + (x > 10) * (x - 10) / 2,
+        cible,
+        depart = array([0, 0, 0, 0, 0]),
+        )
+    assert_near(solution, [-10, 0, 5, 70, 1990], absolute_error_margin = 1e-3)
+
+
+def test_inversion_numerique():
+    reform = compose_reforms([irpp_remplace, de_net_a_brut.de_net_a_brut], tax_benefit_system)
+    assert not de_net_a_brut.formules_de_reference(reform)
+    simulation = reform.new_scenario().init_single_entity(
+        period = 2011,
+        parent1 = dict(salaire_net_a_payer = 14700.25),
+        ).new_simulation()
+    assert_near(simulation.calculate('salaire_imposable', '2011-01'), 17710 / 12, absolute_error_margin = 0.005)
+
+
+def test_inversion_trace():
+    reform = de_net_a_brut.de_net_a_brut(tax_benefit_system)
+    for year in (2010, 2016):
+        scenario = reform.new_scenario().init_single_entity(
+            period = year,
+            parent1 = dict(salaire_net_a_payer = 14700.25),
+            )
+        month = '{}-01'.format(year)
+        assert_near(
+            scenario.new_simulation(trace = True).calculate('salaire_imposable', month),
+            scenario.new_simulation().calculate('salaire_imposable', month),
+            absolute_error_margin = 0.005,
+            )
+
+
+if __name__ == '__main__':
+    test_resoudre()
+    test_inversion_numerique()
+    test_inversion_trace()
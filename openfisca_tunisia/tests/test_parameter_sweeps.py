@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+from openfisca_tunisia.parameter_sweeps import calculate_sweep, calibrate
+from openfisca_tunisia.reform_deltas import record_legislation_reads
+from openfisca_tunisia.tests.base import assert_near, irpp_salaire_imposable, new_household_scenario
+
+
+def new_simulation(name = 'salaire_imposable'):
+    simulation = new_household_scenario(name).new_simulation()
+    record_legislation_reads(simulation)
+    return simulation
+
+
+def test_sweep_bareme():
+    simulation = new_simulation()
+    assert_near(simulation.calculate('irpp', 2016), irpp_salaire_imposable, absolute_error_margin = 0.01)
+    array_by_name = calculate_sweep(
+        simulation,
+        ('impot_revenu', 'bareme', 'rates', 3),
+        [.25, .27, .30],
+        ['irpp', 'salaire_net_a_payer'],
+        2016,
+        )
+    # 5789 DT of the net taxable income are in the bracket from 10000 to 20000 DT
+    irpp = [irpp_salaire_imposable, irpp_salaire_imposable - .02 * 5789, irpp_salaire_imposable - .05 * 5789]
+    assert_near(array_by_name['irpp'][:, 0], irpp, absolute_error_margin = 0.01)
+    assert_near(array_by_name['salaire_net_a_payer'][:, 0], [17710 + value for value in irpp],
+        absolute_error_margin = 0.01)
+    assert_near(simulation.calculate('irpp', 2016), irpp_salaire_imposable, absolute_error_margin = 0.01)
+
+
+def test_sweep_deduction():
+    simulation = new_simulation()
+    array_by_name = calculate_sweep(
+        simulation,
+        ('impot_revenu', 'deduc', 'fam', 'chef_de_famille'),
+        [150, 300],
+        ['rni'],
+        2016,
+        )
+    assert_near(array_by_name['rni'][:, 0], [15789, 15639], absolute_error_margin = 0.01)
+
+
+def test_sweep_input():
+    # salaire_imposable is an input of the household, in the dependency cone of the SMIG
+    simulation = new_simulation()
+    array_by_name = calculate_sweep(
+        simulation,
+        ('cotisations_sociales', 'gen', 'smig_40h_mensuel'),
+        [289.639, 2000],
+        ['irpp', 'salaire_imposable'],
+        2016,
+        )
+    assert_near(array_by_name['salaire_imposable'][:, 0], [17710, 17710], absolute_error_margin = 0.01)
+    assert_near(array_by_name['irpp'][:, 0], [irpp_salaire_imposable, -2722.25], absolute_error_margin = 0.01)
+
+
+def test_calibrate():
+    simulation = new_simulation()
+    taux = calibrate(
+        simulation,
+        ('impot_revenu', 'bareme', 'rates', 3),
+        target = irpp_salaire_imposable - .02 * 5789,
+        period = 2016,
+        bounds = (.2, .4),
+        )
+    assert_near(taux, .27, absolute_error_margin = 1e-5)
+
+
+def test_calibrate_input():
+    # The SMIG deduction applies once the annual SMIG reaches the input salaire_imposable of the household
+    simulation = new_simulation()
+    smig_40h_mensuel = calibrate(
+        simulation,
+        ('cotisations_sociales', 'gen', 'smig_40h_mensuel'),
+        target = (irpp_salaire_imposable - 2722.25) / 2,
+        period = 2016,
+        bounds = (1000, 2000),
+        )
+    assert_near(smig_40h_mensuel, 17710 / 12, absolute_error_margin = 1e-3)
+
+
+if __name__ == '__main__':
+    test_sweep_bareme()
+    test_sweep_deduction()
+    test_sweep_input()
+    test_calibrate()
+    test_calibrate_input()
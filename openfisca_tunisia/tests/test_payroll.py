@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import csv
+from StringIO import StringIO
+
+from openfisca_tunisia.payroll import iter_payslips
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+registry = '''\
+matricule,categorie_salarie,salaire_de_base,primes
+1,8,657,1045.666
+2,rsna,416.624,53.58
+3,,1200,
+'''
+
+
+def test_payslips():
+    payslips = list(iter_payslips(tax_benefit_system, csv.DictReader(StringIO(registry)), '2016-04', chunk_size = 2))
+    assert [payslip['matricule'] for payslip in payslips] == ['1', '2', '3']
+    # Cf. tests/fiches_de_paie
+    assert_near(payslips[0]['assiette_cotisations_sociales'], 1702.666, absolute_error_margin = 0.5)
+    assert_near(payslips[0]['retraite_salarie'], -139.618, absolute_error_margin = 0.5)
+    assert_near(payslips[0]['ugtt'], -3, absolute_error_margin = 0.5)
+    assert_near(payslips[1]['cotisations_salarie'], -43.164, absolute_error_margin = 0.5)
+    assert_near(payslips[1]['salaire_imposable'], 427.040, absolute_error_margin = 0.5)
+    assert_near(payslips[2]['assiette_cotisations_sociales'], 1200, absolute_error_margin = 0.5)
+
+
+if __name__ == '__main__':
+    test_payslips()
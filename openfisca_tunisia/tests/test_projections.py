@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from openfisca_tunisia.projections import calculate_projection
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+def new_scenario(year):
+    return tax_benefit_system.new_scenario().init_single_entity(
+        period = year,
+        parent1 = dict(male = True, marie = True, salaire_de_base = 30000, categorie_salarie = 0),
+        parent2 = dict(salaire_de_base = 4000, categorie_salarie = 8),
+        )
+
+
+def test_projection():
+    # Legislations before and after the introduction of smig_ext don't have the same parameters.
+    years = range(2008, 2018)
+    variables_name = ['irpp', 'salaire_net_a_payer', 'cotisations_salarie', 'revenu_disponible']
+    array_by_name = calculate_projection(new_scenario(2016), variables_name, years)
+    assert array_by_name['irpp'].shape == (len(years), 1)
+    assert array_by_name['salaire_net_a_payer'].shape == (len(years), 2)
+    for index, year in enumerate(years):
+        simulation = new_scenario(year).new_simulation()
+        for name in variables_name:
+            assert_near(array_by_name[name][index], simulation.calculate_add(name, year),
+                absolute_error_margin = 1e-2)
+
+
+if __name__ == '__main__':
+    test_projection()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+from nose.tools import assert_raises
+from openfisca_core import periods
+from openfisca_core.reforms import Reform, update_legislation
+
+from openfisca_tunisia.reform_deltas import (calculate_differences, get_affected_variables, get_changed_parameters,
+    get_variables_reading, new_reform_simulation, record_inputs, record_legislation_reads)
+from openfisca_tunisia.reforms.plf_2017 import plf_2017
+from openfisca_tunisia.tests.base import assert_near, irpp_salaire_imposable, new_household_scenario, tax_benefit_system
+
+
+reform = plf_2017(tax_benefit_system)
+
+
+class smig_2000(Reform):
+    name = u'SMIG à 2000 DT par mois'
+
+    def apply(self):
+        self.modify_legislation_json(modifier_function = lambda legislation_json: update_legislation(
+            legislation_json = legislation_json,
+            path = ('children', 'cotisations_sociales', 'children', 'gen', 'children', 'smig_40h_mensuel', 'values'),
+            period = periods.period(2016),
+            value = 2000,
+            ))
+
+
+def test_changed_parameters():
+    assert get_changed_parameters(tax_benefit_system, reform) == {('impot_revenu', 'bareme')}
+
+
+def test_reform_simulation():
+    simulation = new_household_scenario('salaire_imposable').new_simulation()
+    record_legislation_reads(simulation)
+    simulation.calculate('irpp', 2016)
+    assert ('impot_revenu', 'bareme') in simulation.legislation_reads_by_variable_name['ir_brut']
+
+    affected_variables = get_affected_variables(simulation, reform)
+    assert {'ir_brut', 'irpp', 'revenu_disponible'} <= affected_variables
+    assert 'revenu_assimile_salaire' not in affected_variables
+    assert 'cotisations_salarie' not in affected_variables
+
+    reform_simulation = new_reform_simulation(simulation, reform)
+    assert reform_simulation.foyer_fiscal.get_holder('revenu_assimile_salaire') is \
+        simulation.foyer_fiscal.get_holder('revenu_assimile_salaire')
+    # Le taux de la tranche de 10000 à 20000 DT passe de 25 % à 27 %
+    assert_near(
+        reform_simulation.calculate('irpp', 2016),
+        irpp_salaire_imposable - .02 * (15789 - 10000),
+        absolute_error_margin = 0.01,
+        )
+    assert_near(simulation.calculate('irpp', 2016), irpp_salaire_imposable, absolute_error_margin = 0.01)
+
+
+def test_legislation_reads_helper():
+    # Les barèmes des cotisations sont lus par get_baremes_cotisations, fonction du module appelée par la formule
+    simulation = new_household_scenario('salaire_de_base').new_simulation()
+    record_legislation_reads(simulation)
+    simulation.calculate('maladie_salarie', '2016-01')
+    reads_by_variable_name = simulation.legislation_reads_by_variable_name
+    assert ('cotisations_sociales',) in reads_by_variable_name['maladie_salarie']
+    assert not reads_by_variable_name.get(None)
+    assert 'maladie_salarie' in get_variables_reading(simulation, [('cotisations_sociales', 'rsna')])
+
+
+def test_legislation_reads_outside_formulas():
+    simulation = new_household_scenario('salaire_imposable').new_simulation()
+    record_legislation_reads(simulation)
+    simulation.calculate('irpp', 2016)
+    parameters = [('impot_revenu', 'bareme')]
+    assert 'revenu_assimile_salaire_apres_abattements' not in get_variables_reading(simulation, parameters)
+    # Une lecture hors de toute formule ne peut être attribuée : les lectures enregistrées ne sont plus utilisées.
+    simulation.legislation_at(periods.instant('2016-01-01')).impot_revenu.tspr.abat_sal
+    assert 'revenu_assimile_salaire_apres_abattements' in get_variables_reading(simulation, parameters)
+
+
+def test_reform_simulation_inputs():
+    # Sans enregistrer les lectures de la législation : salaire_imposable, saisi, est recalculé par la réforme.
+    simulation = new_household_scenario('salaire_imposable').new_simulation()
+    record_inputs(simulation)
+    assert_near(simulation.calculate('irpp', 2016), irpp_salaire_imposable, absolute_error_margin = 0.01)
+    reform_simulation = new_reform_simulation(simulation, smig_2000(tax_benefit_system))
+    assert_near(reform_simulation.calculate('irpp', 2016), -2722.25, absolute_error_margin = 0.01)
+
+    # Sans les entrées, la réforme recalculerait salaire_imposable
+    simulation = new_household_scenario('salaire_imposable').new_simulation()
+    with assert_raises(ValueError):
+        new_reform_simulation(simulation, smig_2000(tax_benefit_system))
+
+
+def test_calculate_differences():
+    difference_by_name = calculate_differences(
+        new_household_scenario('salaire_imposable'),
+        reform,
+        ['irpp', 'revenu_disponible', 'salaire_net_a_payer', 'cotisations_salarie'],
+        2016,
+        )
+    assert_near(difference_by_name['irpp'], - .02 * (15789 - 10000), absolute_error_margin = 0.01)
+    assert_near(difference_by_name['revenu_disponible'], - .02 * (15789 - 10000), absolute_error_margin = 0.01)
+    assert_near(difference_by_name['salaire_net_a_payer'], - .02 * (15789 - 10000), absolute_error_margin = 0.01)
+    assert_near(difference_by_name['cotisations_salarie'], 0, absolute_error_margin = 0.01)
+
+
+def test_calculate_differences_pension():
+    # Le revenu net imposable de 29850 DT vient surtout de la pension : la tranche de 10000 à 20000 DT est pleine.
+    difference_by_name = calculate_differences(
+        new_household_scenario('pension'),
+        reform,
+        ['irpp', 'revenu_disponible'],
+        2016,
+        )
+    assert_near(difference_by_name['irpp'], - .02 * 10000, absolute_error_margin = 0.01)
+    assert_near(difference_by_name['revenu_disponible'], - .02 * 10000, absolute_error_margin = 0.01)
+
+
+if __name__ == '__main__':
+    test_changed_parameters()
+    test_reform_simulation()
+    test_legislation_reads_helper()
+    test_legislation_reads_outside_formulas()
+    test_reform_simulation_inputs()
+    test_calculate_differences()
+    test_calculate_differences_pension()
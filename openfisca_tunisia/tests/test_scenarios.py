@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import raises
+
+from openfisca_core import periods
+
+from openfisca_tunisia.tests.base import assert_near, tax_benefit_system
+
+
+def repair(test_case):
+    scenario = tax_benefit_system.new_scenario()
+    test_case, error = scenario.make_json_or_python_to_test_case(periods.period(2016), repair = True)(test_case)
+    assert error is None, error
+    return test_case
+
+
+def test_attribute_groupless_persons_to_entities():
+    test_case = repair(dict(
+        individus = [dict(id = 'parent1'), dict(id = 'parent2'), dict(id = 'enfant', age = 10), dict(id = 'seul')],
+        foyers_fiscaux = [dict(id = 'foyer_fiscal', declarants = ['parent1'])],
+        menages = [dict(id = 'menage', personne_de_reference = 'parent1', conjoint = 'parent2',
+            enfants = ['enfant'])],
+        ))
+    foyer_fiscal, new_foyer_fiscal = test_case['foyers_fiscaux']
+    assert foyer_fiscal['declarants'] == ['parent1', 'parent2']
+    assert foyer_fiscal['personnes_a_charge'] == ['enfant']
+    assert new_foyer_fiscal['declarants'] == ['seul']
+    assert test_case['menages'][1]['personne_de_reference'] == 'seul'
+
+
+def test_attribute_groupless_persons_to_entities_by_foyer_fiscal():
+    count = 1000
+    individus = []
+    menages = []
+    for index in range(count):
+        individus.extend([dict(id = 'parent1_{}'.format(index)), dict(id = 'parent2_{}'.format(index)),
+            dict(id = 'enfant_{}'.format(index), age = 10)])
+        menages.append(dict(id = 'menage_{}'.format(index), personne_de_reference = 'parent1_{}'.format(index)))
+    foyers_fiscaux = [
+        dict(
+            id = 'foyer_fiscal_{}'.format(index),
+            declarants = ['parent1_{}'.format(index), 'parent2_{}'.format(index)],
+            personnes_a_charge = ['enfant_{}'.format(index)],
+            )
+        for index in range(count)
+        ]
+    test_case = repair(dict(individus = individus, foyers_fiscaux = foyers_fiscaux, menages = menages))
+    assert len(test_case['menages']) == count
+    for index, menage in enumerate(test_case['menages']):
+        assert menage['conjoint'] == 'parent2_{}'.format(index)
+        assert menage['enfants'] == ['enfant_{}'.format(index)]
+
+
+def new_test_case():
+    return dict(
+        individus = [dict(id = 'parent1', salaire_de_base = 30000.0), dict(id = 'parent2', salaire_de_base = 4000.0),
+            dict(id = 'enfant1'), dict(id = 'enfant2')],
+        foyers_fiscaux = [dict(id = 'foyer_fiscal', declarants = ['parent1', 'parent2'],
+            personnes_a_charge = ['enfant1', 'enfant2'])],
+        menages = [dict(id = 'menage', personne_de_reference = 'parent1', conjoint = 'parent2',
+            enfants = ['enfant1', 'enfant2'])],
+        )
+
+
+def test_trusted_test_case():
+    year = 2016
+    simulation = tax_benefit_system.new_scenario().init_from_test_case(year, new_test_case()).new_simulation()
+    for check in (True, False):
+        trusted_simulation = tax_benefit_system.new_scenario().init_from_trusted_test_case(year, new_test_case(),
+            check = check).new_simulation()
+        for name in ('irpp', 'revenu_disponible'):
+            assert_near(trusted_simulation.calculate(name, year), simulation.calculate(name, year),
+                absolute_error_margin = 1e-3)
+
+
+@raises(ValueError)
+def test_trusted_test_case_without_menage():
+    test_case = new_test_case()
+    test_case['menages'][0]['enfants'] = ['enfant1']
+    tax_benefit_system.new_scenario().init_from_trusted_test_case(2016, test_case)
+
+
+def test_trusted_test_case_by_period():
+    year = 2016
+    simulation = tax_benefit_system.new_scenario().init_from_test_case(year, new_test_case()).new_simulation()
+    test_case = new_test_case()
+    test_case['individus'][0]['salaire_de_base'] = {periods.period(year): 30000.0}
+    trusted_simulation = tax_benefit_system.new_scenario().init_from_trusted_test_case(year, test_case).new_simulation()
+    assert_near(trusted_simulation.calculate('irpp', year), simulation.calculate('irpp', year),
+        absolute_error_margin = 1e-3)
+
+
+@raises(ValueError)
+def test_trusted_test_case_without_declarant():
+    test_case = new_test_case()
+    foyer_fiscal = test_case['foyers_fiscaux'][0]
+    foyer_fiscal['personnes_a_charge'] = foyer_fiscal['declarants'] + foyer_fiscal['personnes_a_charge']
+    foyer_fiscal['declarants'] = []
+    tax_benefit_system.new_scenario().init_from_trusted_test_case(2016, test_case)
+
+
+@raises(ValueError)
+def test_trusted_test_case_without_personne_de_reference():
+    test_case = new_test_case()
+    menage = test_case['menages'][0]
+    menage['autres'] = [menage['personne_de_reference']]
+    menage['personne_de_reference'] = None
+    tax_benefit_system.new_scenario().init_from_trusted_test_case(2016, test_case)
+
+
+@raises(ValueError)
+def test_trusted_test_case_by_period_string():
+    test_case = new_test_case()
+    test_case['individus'][0]['salaire_de_base'] = {'2016': 30000.0}
+    tax_benefit_system.new_scenario().init_from_trusted_test_case(2016, test_case)
+
+
+if __name__ == '__main__':
+    test_attribute_groupless_persons_to_entities()
+    test_attribute_groupless_persons_to_entities_by_foyer_fiscal()
+    test_trusted_test_case()
+    test_trusted_test_case_without_menage()
+    test_trusted_test_case_without_declarant()
+    test_trusted_test_case_without_personne_de_reference()
+    test_trusted_test_case_by_period()
+    test_trusted_test_case_by_period_string()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+from openfisca_tunisia.sensitivities import calculate_derivatives
+from openfisca_tunisia.tests.base import assert_near, new_household_scenario
+
+
+def new_scenario(salaire_de_base):
+    return new_household_scenario('salaire_de_base', salaire_de_base = salaire_de_base)
+
+
+def test_derivatives():
+    variables_name = ['irpp', 'salaire_net_a_payer']
+    derivative_by_name = calculate_derivatives(new_scenario(30000), variables_name, 'salaire_de_base', 2016)
+    step = 100
+    for name in variables_name:
+        simulation = new_scenario(30000).new_simulation()
+        other_simulation = new_scenario(30000 + step).new_simulation()
+        if name == 'irpp':
+            difference = other_simulation.calculate('irpp', 2016) - simulation.calculate('irpp', 2016)
+        else:
+            difference = other_simulation.calculate_add(name, 2016) - simulation.calculate_add(name, 2016)
+        # The salary of the spouse doesn't change the income tax, computed on the salary of the main declarant.
+        assert_near(derivative_by_name[name][0], difference[0] / step, absolute_error_margin = 1e-3)
+    assert_near(derivative_by_name['irpp'][1], 0, absolute_error_margin = 1e-9)
+
+
+def test_derivative_net_brut():
+    derivative_by_name = calculate_derivatives(new_scenario(30000), ['salaire_net_a_payer'], 'salaire_de_base',
+        '2016-03')
+    # Employee contributions of 9.18 %, income tax marginal rate of 30 % after the 10 % allowance, withheld monthly
+    assert_near(derivative_by_name['salaire_net_a_payer'], [.9082 * (1 - .3 * .9 / 12), .9082],
+        absolute_error_margin = 1e-6)
+
+
+if __name__ == '__main__':
+    test_derivatives()
+    test_derivative_net_brut()
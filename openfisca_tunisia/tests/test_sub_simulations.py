@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+from openfisca_core import periods
+
+from openfisca_tunisia.sub_simulations import get_dependency_cone, new_sub_simulation
+from openfisca_tunisia.tests.base import assert_near, irpp_salaire_imposable, new_household_scenario, tax_benefit_system
+
+
+def test_dependency_cone():
+    cone = get_dependency_cone(tax_benefit_system, ['salaire_imposable'])
+    assert {'salaire_imposable', 'revenu_assimile_salaire', 'rni', 'irpp', 'salaire_net_a_payer'} <= cone
+    assert 'assiette_cotisations_sociales' not in cone
+    assert 'chef_de_famille' not in cone
+
+
+def test_sub_simulation():
+    year = 2016
+    simulation = new_household_scenario('salaire_imposable', period = year).new_simulation()
+    assert_near(simulation.calculate('irpp', year), irpp_salaire_imposable, absolute_error_margin = 0.5)
+
+    sub_simulation = new_sub_simulation(simulation, ['salaire_imposable'])
+    assert sub_simulation.persons.get_holder('male') is simulation.persons.get_holder('male')
+    assert sub_simulation.foyer_fiscal.get_holder('chef_de_famille') is \
+        simulation.foyer_fiscal.get_holder('chef_de_famille')
+    sub_simulation.persons.get_holder('salaire_imposable').set_input(
+        periods.period(year), sub_simulation.persons.filled_array(0))
+    assert_near(sub_simulation.calculate('irpp', year), 0, absolute_error_margin = 0.5)
+    assert_near(simulation.calculate('irpp', year), irpp_salaire_imposable, absolute_error_margin = 0.5)
+
+
+if __name__ == '__main__':
+    test_dependency_cone()
+    test_sub_simulation()
@@ -11,15 +11,14 @@ from openfisca_tunisia.tests import base
 nottest(generate_tests)
 
 options_by_dir = {
+    'reforms/de_net_a_brut': {
+        'reforms': ['de_net_a_brut'],
+        },
     'reforms/plf_2017': {
         'reforms': ['plf_2017'],
         },
     'fiches_de_paie': {},
     'formulas': {},
-    'scipy': {
-        'reforms': ['de_net_a_brut'],
-        'requires': 'scipy'
-        },
     }
 
 